@@ -1,20 +1,83 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, Response, render_template, request, send_file, jsonify
+import io
+import json
 import re
 import requests
 import os
+import glob
+import threading
+import time
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from unidecode import unidecode
 from datetime import datetime
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from roster import RosterTable, save_snapshot, load_snapshot
+from matcher import MssvMatcher
+from profiling import RequestProfiler
+from result_store import ResultStore
+from offline_corpus import load_corpus
+from change_feed import ChangeFeed, ALL
 
 app = Flask(__name__)
 
 EXCEL_FILE = os.environ.get("EXCEL_FILE", "nrl.xlsx")
+# Nhiều registry (mỗi học kỳ/khoa một file): cách nhau bởi "," hoặc ";", hỗ trợ glob
+# VD: EXCEL_FILES="registry/*.xlsx;nrl_khoa_cntt.xlsx"
+EXCEL_FILES = os.environ.get("EXCEL_FILES", EXCEL_FILE)
 MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 20))
 REQUEST_TIMEOUT = 8
+# Số sinh viên tối đa trong một lần tra cứu hàng loạt (/search/batch)
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 10000))
+# Token cho các endpoint quản trị (/roster...). Để trống: chỉ cho phép truy cập từ máy local
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Tổng hợp roster ngay khi warm-up (trước khi fork worker ở chế độ production)
+ROSTER_PRELOAD = os.environ.get("ROSTER_PRELOAD", "false").lower() == "true"
+# Thư mục dùng chung roster giữa các worker process (để trống: mỗi process tự build)
+ROSTER_DIR = os.environ.get("ROSTER_DIR", "")
+ROSTER_BUILD_TIMEOUT = 3600  # Giây; file đánh dấu cũ hơn coi như process build đã chết
+# Thư mục lưu file .prof khi profile /search
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# Kết quả /search lưu phía server để /download dùng lại (giây, số entry tối đa)
+RESULT_TTL = int(os.environ.get("RESULT_TTL", 1800))
+RESULT_STORE_SIZE = int(os.environ.get("RESULT_STORE_SIZE", 1000))
+# Thư mục dùng chung kết quả giữa các worker process (để trống: chỉ lưu trong RAM)
+RESULT_STORE_DIR = os.environ.get("RESULT_STORE_DIR", "")
+# Chế độ offline: thư mục hoặc file .zip chứa các doc export (.txt/.docx đặt tên theo doc ID).
+# Khi bật, nội dung doc chỉ lấy từ corpus này, không gọi mạng.
+OFFLINE_CORPUS = os.environ.get("OFFLINE_CORPUS", "")
+# Làm mới định kỳ (giây, 0: tắt): đọc lại registry, build lại roster và ghi sự kiện
+# thay đổi cho các MSSV đã đăng ký theo dõi (/subscriptions, /changes)
+REFRESH_INTERVAL = int(os.environ.get("REFRESH_INTERVAL", 0))
+# Thư mục dùng chung đăng ký / sự kiện giữa các worker process (để trống: chỉ lưu trong RAM)
+CHANGES_DIR = os.environ.get("CHANGES_DIR", "")
+CHANGES_MAX_EVENTS = int(os.environ.get("CHANGES_MAX_EVENTS", 10000))
+MAX_SUBSCRIPTIONS = int(os.environ.get("MAX_SUBSCRIPTIONS", 50000))
+# Đăng ký không hỏi /changes trong khoảng này (giây) thì hết hạn và bị xóa
+SUBSCRIPTION_TTL = int(os.environ.get("SUBSCRIPTION_TTL", 7 * 86400))
+# Đăng ký mới chưa hỏi /changes lần nào thì hết hạn sớm hơn nhiều (giây): đăng ký
+# hàng loạt rồi bỏ đó không chiếm hết MAX_SUBSCRIPTIONS của người dùng thật
+SUBSCRIPTION_PENDING_TTL = int(os.environ.get("SUBSCRIPTION_PENDING_TTL", 600))
+# Long-poll /changes?wait= và SSE /changes/stream: thời gian giữ kết nối tối đa (giây)
+# và số kết nối chờ đồng thời mỗi process (mỗi kết nối chiếm một thread của server)
+CHANGES_MAX_WAIT = int(os.environ.get("CHANGES_MAX_WAIT", 30))
+CHANGES_MAX_WAITERS = int(os.environ.get("CHANGES_MAX_WAITERS", 4))
 
 _cached_docs = None
+_docs_lock = threading.Lock()
+_docs_loaded_at = 0.0
+_roster = None
+_roster_lock = threading.Lock()
+_roster_building = False
+_roster_mtime = None  # mtime của file snapshot roster đã nạp (ROSTER_DIR)
+_offline_corpus = None
+_offline_lock = threading.Lock()
+_result_store = ResultStore(RESULT_STORE_SIZE, RESULT_TTL, RESULT_STORE_DIR or None)
+_layout_cache = {}  # doc key -> (hash nội dung, layout)
+_change_feed = ChangeFeed(CHANGES_MAX_EVENTS, CHANGES_DIR or None, SUBSCRIPTION_TTL, SUBSCRIPTION_PENDING_TTL)
+_change_waiters = threading.BoundedSemaphore(CHANGES_MAX_WAITERS)
+_refresher_running = False
 
 # Pre-compile regex patterns
 RE_DOC_ID = re.compile(r'/d/([a-zA-Z0-9_-]+)')
@@ -25,52 +88,239 @@ RE_NRL = re.compile(r'^(\d+\.?\d*)$')
 RE_MSSV = re.compile(r'\b\d{8,12}\b')
 # Pattern cho dòng bảng (chứa nhiều cột)
 RE_TABLE_ROW = re.compile(r'[\t|]|(?:\s{2,})')
+# Họ tên: ít nhất 2 từ, chỉ gồm chữ cái
+RE_NAME = re.compile(r"^[^\W\d_]+(?:[ .'-]+[^\W\d_]+)+$")
+# Mã lớp, VD: D22_TH01, DH22IT01, K24CNTT
+RE_CLASS = re.compile(r'^[A-Za-z]{1,5}\d{2}[A-Za-z0-9_.-]*$')
 
+# Phân loại layout doc: cần ít nhất bấy nhiêu dòng MSSV, phần lớn dòng theo cùng số cột,
+# và mỗi vai trò cột (STT/tên/NRL) phải đúng ở đa số dòng
+LAYOUT_MIN_ROWS = 3
+LAYOUT_MIN_SHARE = 0.5
+LAYOUT_ROLE_SHARE = 0.8
 
-def get_doc_links():
-    global _cached_docs
-    if _cached_docs is not None:
-        return _cached_docs
-    
-    if not os.path.exists(EXCEL_FILE):
-        print(f"[ERROR] File {EXCEL_FILE} khong ton tai!")
-        return []
+
+def get_excel_files():
+    """Danh sách file registry từ EXCEL_FILES (đã mở rộng glob, bỏ trùng)"""
+    files = []
+    for pattern in re.split(r'[;,]', EXCEL_FILES):
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for f in matches:
+            if f not in files:
+                files.append(f)
+    return files
+
+
+def get_doc_key(link):
+    """Khóa định danh doc: doc ID (để /edit và /view của cùng 1 doc không bị trùng)"""
+    match = RE_DOC_ID.search(link)
+    return match.group(1) if match else link
+
+
+def get_registry_tags(files):
+    """
+    Nhãn nguồn của từng registry: đường dẫn (bỏ đuôi) tính từ thư mục làm việc (launcher
+    chuyển về thư mục chứa app), để nhãn không đổi khi thêm/bớt registry khác và các file
+    trùng tên ở thư mục khác nhau không bị gộp nhãn.
+    VD: nrl.xlsx -> "nrl"; hk1/nrl.xlsx, hk2/nrl.xlsx -> "hk1/nrl", "hk2/nrl"
+    Registry ở ổ đĩa khác (Windows) không tính được đường dẫn tương đối -> dùng tên file.
+    """
+    tags = {}
+    for f in files:
+        try:
+            rel = os.path.relpath(os.path.abspath(f))
+        except ValueError:
+            rel = os.path.basename(f)
+        tags[f] = os.path.splitext(rel)[0].replace(os.sep, "/")
+    return tags
+
+
+def load_registry(path, tag=None):
+    """Đọc hyperlink Google Docs từ TẤT CẢ sheet của một file Excel, gắn nhãn nguồn"""
+    stem = tag or os.path.splitext(os.path.basename(path))[0]
+    wb = load_workbook(path)
     
-    try:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb.active
-        
-        doc_links = []
+    doc_links = []
+    for ws in wb.worksheets:
+        source = f"{stem}/{ws.title}"
         for row in ws.iter_rows():
             for cell in row:
                 if cell.hyperlink and cell.hyperlink.target:
                     link = cell.hyperlink.target
                     if "docs.google.com/document" in link:
                         cell_value = str(cell.value) if cell.value else ""
-                        doc_links.append({"link": link, "name": cell_value})
+                        doc_links.append({"link": link, "name": cell_value, "source": source})
+    return doc_links
+
+
+def get_doc_links(reload=False):
+    """
+    Danh sách doc từ các registry, nạp một lần.
+    reload=True: đọc lại registry (phát hiện doc mới); các thread khác vẫn dùng danh sách
+    cũ trong lúc đọc, đọc lỗi / rỗng thì giữ danh sách cũ.
+    """
+    global _cached_docs, _docs_loaded_at
+    if _cached_docs is not None and not reload:
+        # Bật làm mới định kỳ: mỗi process tự nạp lại registry ở nền khi quá hạn
+        if REFRESH_INTERVAL and time.time() - _docs_loaded_at > REFRESH_INTERVAL and not _docs_lock.locked():
+            _docs_loaded_at = time.time()
+            threading.Thread(target=get_doc_links, kwargs={"reload": True}, daemon=True).start()
+        return _cached_docs
+    
+    with _docs_lock:
+        if _cached_docs is not None and not reload:
+            return _cached_docs
+        
+        files = []
+        for f in get_excel_files():
+            if os.path.exists(f):
+                files.append(f)
+            else:
+                print(f"[ERROR] File {f} khong ton tai!")
+        if not files and not OFFLINE_CORPUS:
+            return _cached_docs or []
+        
+        # Đọc song song các workbook
+        loaded = {}
+        if files:
+            with ThreadPoolExecutor(max_workers=min(len(files), MAX_WORKERS)) as executor:
+                tags = get_registry_tags(files)
+                futures = {executor.submit(load_registry, f, tags[f]): f for f in files}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        loaded[path] = future.result()
+                    except Exception as e:
+                        print(f"[ERROR] Load Excel {path} failed: {e}")
+        
+        if reload and _cached_docs is not None and len(loaded) < len(files):
+            # Có workbook đọc lỗi: giữ danh sách cũ, tránh báo doc bị xóa
+            return _cached_docs
+        
+        # Gộp theo thứ tự cấu hình, bỏ trùng theo doc ID và giữ lại mọi nguồn chứa doc
+        docs_by_key = {}
+        for path in files:
+            for doc in loaded.get(path, []):
+                key = get_doc_key(doc["link"])
+                existing = docs_by_key.get(key)
+                if existing is None:
+                    docs_by_key[key] = {
+                        "link": doc["link"],
+                        "name": doc["name"],
+                        "doc_id": key,
+                        "sources": [doc["source"]],
+                    }
+                    continue
+                if doc["source"] not in existing["sources"]:
+                    existing["sources"].append(doc["source"])
+                if not existing["name"]:
+                    existing["name"] = doc["name"]
+        
+        # Doc chỉ có trong corpus offline (không nằm trong registry nào)
+        for doc_id in get_offline_corpus():
+            if doc_id not in docs_by_key:
+                docs_by_key[doc_id] = {
+                    "link": f"https://docs.google.com/document/d/{doc_id}/edit",
+                    "name": doc_id,
+                    "doc_id": doc_id,
+                    "sources": ["offline"],
+                }
         
-        seen = set()
-        unique_docs = []
-        for doc in doc_links:
-            if doc["link"] not in seen:
-                seen.add(doc["link"])
-                unique_docs.append(doc)
+        if not docs_by_key:
+            return _cached_docs or []
         
+        unique_docs = list(docs_by_key.values())
         _cached_docs = unique_docs
-        print(f"[INFO] Loaded {len(unique_docs)} docs from Excel")
+        _docs_loaded_at = time.time()
+        print(f"[INFO] Loaded {len(unique_docs)} docs from {len(loaded)} Excel file(s)")
         return unique_docs
-    except Exception as e:
-        print(f"[ERROR] Load Excel failed: {e}")
-        return []
+
+
+def get_offline_corpus():
+    """Corpus offline {doc_id: text}, nạp một lần; rỗng nếu không bật chế độ offline"""
+    global _offline_corpus
+    if _offline_corpus is not None or not OFFLINE_CORPUS:
+        return _offline_corpus or {}
+    
+    with _offline_lock:
+        if _offline_corpus is None:
+            started = time.perf_counter()
+            try:
+                _offline_corpus = load_corpus(OFFLINE_CORPUS, MAX_WORKERS)
+            except Exception as e:
+                print(f"[ERROR] Load offline corpus failed: {e}")
+                _offline_corpus = {}
+            size_mb = sum(len(t) for t in _offline_corpus.values()) / 1024 / 1024
+            print(f"[INFO] Offline corpus: {len(_offline_corpus)} docs, {size_mb:.1f} MB, "
+                  f"{time.perf_counter() - started:.2f}s")
+    return _offline_corpus
+
+
+def filter_docs_by_source(docs, scopes):
+    """
+    Lọc docs theo nguồn: "nrl_hk1" khớp mọi sheet của file, "nrl_hk1/CNTT" khớp đúng sheet;
+    registry ở thư mục con: "hk1" khớp mọi file trong hk1/
+    """
+    if not scopes:
+        return docs
+    
+    def in_scope(source):
+        return any(source == s or source.startswith(s + "/") for s in scopes)
+    
+    return [doc for doc in docs if any(in_scope(src) for src in doc["sources"])]
+
+
+def parse_sources_param(value):
+    """Tách tham số sources dạng "a,b,c" thành list"""
+    return [s.strip() for s in (value or "").split(',') if s.strip()]
+
+
+def count_docs_by_source(docs):
+    counts = {}
+    for doc in docs:
+        for src in doc["sources"]:
+            counts[src] = counts.get(src, 0) + 1
+    return counts
+
+
+def warm_up():
+    """Nạp trước các cache dùng chung (danh sách docs...) trước khi phục vụ request.
+
+    Ở chế độ production, launcher gọi hàm này TRƯỚC khi fork worker để các
+    process con dùng chung bộ nhớ đã nạp (copy-on-write) thay vì tự nạp lại.
+    """
+    get_offline_corpus()
+    docs = get_doc_links()
+    print(f"[INFO] Warm-up: {len(docs)} docs")
+    if ROSTER_PRELOAD:
+        build_roster()
+    return docs
+
+
+def create_session():
+    """Session HTTP dùng chung cho các thread đọc Google Docs"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=MAX_WORKERS,
+        pool_maxsize=MAX_WORKERS
+    )
+    session.mount('https://', adapter)
+    session.headers.update({"User-Agent": "Mozilla/5.0"})
+    return session
 
 
 def read_doc_text(url, session):
-    """Đọc nội dung Google Docs với retry"""
+    """Đọc nội dung Google Docs với retry (chế độ offline: lấy từ corpus local)"""
     try:
         match = RE_DOC_ID.search(url)
         if not match:
             return None
         doc_id = match.group(1)
+        if OFFLINE_CORPUS:
+            return get_offline_corpus().get(doc_id)
         export_url = f"https://docs.google.com/document/d/{doc_id}/export?format=txt"
         
         # Retry 2 lần
@@ -207,15 +457,188 @@ def find_stt_in_line(line, mssv):
     return None
 
 
-def find_student_in_content(content, ten_sv, mssv):
+def parse_stt_cell(cell):
+    """Giá trị STT của một ô, None nếu không phải STT hợp lệ"""
+    if not is_valid_stt(cell):
+        return None
+    val = extract_stt_value(cell)
+    return val if val is not None and val <= 10000 else None
+
+
+def parse_nrl_cell(cell):
+    """Giá trị NRL của một ô (chấp nhận dấu phẩy thập phân), None nếu không hợp lệ"""
+    cell = cell.replace(',', '.').strip()
+    if len(cell) > 4:
+        return None
+    valid, val = is_valid_nrl(cell)
+    return val if valid else None
+
+
+def _share(values, predicate):
+    values = list(values)
+    if not values:
+        return 0.0
+    return sum(1 for v in values if predicate(v)) / len(values)
+
+
+def _increasing_share(values):
+    """Tỉ lệ cặp liên tiếp tăng dần (cột STT)"""
+    pairs = [(a, b) for a, b in zip(values, values[1:]) if a is not None and b is not None]
+    if not pairs:
+        return 0.0
+    return sum(1 for a, b in pairs if b > a) / len(pairs)
+
+
+def _detect_table_layout(rows):
+    """rows: [(dòng đã strip, mssv)] của các dòng chứa MSSV"""
+    splits = [(parse_table_row(line), mssv) for line, mssv in rows]
+    ncols = Counter(len(parts) for parts, _ in splits).most_common(1)[0][0]
+    if ncols < 3:
+        return None
+
+    conforming = [(parts, mssv) for parts, mssv in splits if len(parts) == ncols and mssv in parts]
+    if len(conforming) < LAYOUT_MIN_ROWS or len(conforming) < len(rows) * LAYOUT_MIN_SHARE:
+        return None
+    mssv_col, count = Counter(parts.index(mssv) for parts, mssv in conforming).most_common(1)[0]
+    if count < len(conforming) * LAYOUT_ROLE_SHARE:
+        return None
+    conforming = [parts for parts, mssv in conforming if parts[mssv_col] == mssv]
+
+    def column(col):
+        return [parts[col] for parts in conforming]
+
+    others = [col for col in range(ncols) if col != mssv_col]
+    # STT: cột đầu tiên trước MSSV toàn số nhỏ tăng dần
+    stt_col = next((col for col in others if col < mssv_col
+                    and _share(column(col), lambda c: parse_stt_cell(c) is not None) >= LAYOUT_ROLE_SHARE
+                    and _increasing_share([parse_stt_cell(c) for c in column(col)]) >= LAYOUT_ROLE_SHARE), None)
+    # NRL: giống find_nrl_in_parts, ưu tiên cột sau MSSV gần nhất
+    nrl_candidates = sorted((col for col in others if col != stt_col),
+                            key=lambda col: (0 if col > mssv_col else 1, abs(col - mssv_col)))
+    nrl_col = next((col for col in nrl_candidates
+                    if _share(column(col), lambda c: parse_nrl_cell(c) is not None) >= LAYOUT_ROLE_SHARE), None)
+    name_col = next((col for col in others
+                     if _share(column(col), lambda c: RE_NAME.match(c) is not None) >= LAYOUT_ROLE_SHARE), None)
+
+    if stt_col is None or nrl_col is None or name_col is None:
+        return None
+    return {"kind": "table", "ncols": ncols, "mssv": mssv_col,
+            "stt": stt_col, "name": name_col, "nrl": nrl_col}
+
+
+def _detect_vertical_layout(lines, positions):
+    """positions: chỉ số các dòng chỉ gồm MSSV (bảng xuất mỗi ô một dòng)"""
+    gaps = Counter(b - a for a, b in zip(positions, positions[1:]))
+    period, count = gaps.most_common(1)[0]
+    if period < 2 or count < (len(positions) - 1) * LAYOUT_ROLE_SHARE:
+        return None
+
+    def cells(offset):
+        return [lines[i + offset].strip() for i in positions if 0 <= i + offset < len(lines)]
+
+    before = range(-1, -period, -1)
+    after = range(1, period)
+    stt_offset = next((off for off in before
+                       if _share(cells(off), lambda c: parse_stt_cell(c) is not None) >= LAYOUT_ROLE_SHARE
+                       and _increasing_share([parse_stt_cell(c) for c in cells(off)]) >= LAYOUT_ROLE_SHARE), None)
+    nrl_offset = next((off for off in after
+                       if _share(cells(off), lambda c: parse_nrl_cell(c) is not None) >= LAYOUT_ROLE_SHARE), None)
+    name_offset = next((off for off in before
+                        if _share(cells(off), lambda c: RE_NAME.match(c) is not None) >= LAYOUT_ROLE_SHARE), None)
+
+    if stt_offset is None or nrl_offset is None or name_offset is None:
+        return None
+    return {"kind": "vertical", "stt": stt_offset, "name": name_offset, "nrl": nrl_offset}
+
+
+def detect_doc_layout(content):
+    """
+    Phân loại layout của doc (chạy MỘT lần cho mỗi nội dung doc):
+      - {"kind": "table", ...}: mỗi sinh viên một dòng, chỉ số cột STT/tên/MSSV/NRL cố định
+      - {"kind": "vertical", ...}: mỗi ô một dòng, STT/tên/NRL cách dòng MSSV một khoảng cố định
+      - None: không phân loại được, dùng heuristics chung của find_student_in_content
+    """
+    lines = content.split('\n')
+    rows = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        match = RE_MSSV.search(stripped)
+        if match:
+            rows.append((i, stripped, match.group()))
+    if len(rows) < LAYOUT_MIN_ROWS:
+        return None
+
+    positions = [i for i, stripped, mssv in rows if stripped == mssv]
+    if len(positions) >= len(rows) * LAYOUT_ROLE_SHARE:
+        return _detect_vertical_layout(lines, positions)
+    return _detect_table_layout([(stripped, mssv) for _, stripped, mssv in rows])
+
+
+def get_doc_layout(doc, content):
+    """Layout của doc, cache theo doc và nội dung (doc được sửa thì phân loại lại)"""
+    key = doc.get("doc_id") or get_doc_key(doc["link"])
+    content_hash = hash(content)
+    cached = _layout_cache.get(key)
+    if cached is not None and cached[0] == content_hash:
+        return cached[1]
+    layout = detect_doc_layout(content)
+    _layout_cache[key] = (content_hash, layout)
+    return layout
+
+
+def count_doc_layouts():
+    counts = Counter((layout or {}).get("kind", "generic") for _, layout in list(_layout_cache.values()))
+    return dict(counts)
+
+
+def find_student_with_layout(lines, layout, mssv, ten_normalized, ten_cuoi, mssv_lines):
+    """
+    Trích STT/NRL theo layout đã phân loại: chỉ đọc đúng các ô của dòng MSSV.
+    Trả về (stt, nrl) khi có dòng khớp cả MSSV lẫn tên; None để quay về heuristics chung
+    (dòng không theo layout, tên không nằm trong ô tên...).
+    """
+    for i in mssv_lines:
+        if layout["kind"] == "table":
+            parts = parse_table_row(lines[i].strip())
+            if len(parts) != layout["ncols"] or parts[layout["mssv"]] != mssv:
+                continue
+            name, stt, nrl = parts[layout["name"]], parts[layout["stt"]], parts[layout["nrl"]]
+        else:
+            if lines[i].strip() != mssv:
+                continue
+            cells = []
+            for offset in (layout["name"], layout["stt"], layout["nrl"]):
+                if not 0 <= i + offset < len(lines):
+                    break
+                cells.append(lines[i + offset].strip())
+            if len(cells) != 3:
+                continue
+            name, stt, nrl = cells
+
+        name_normalized = normalize_text(name)
+        if ten_normalized not in name_normalized and ten_cuoi not in name_normalized:
+            continue
+        stt_val = parse_stt_cell(stt)
+        nrl_val = parse_nrl_cell(nrl)
+        if stt_val is not None and nrl_val is not None:
+            return stt_val, nrl_val
+    return None
+
+
+def find_student_in_content(content, ten_sv, mssv, mssv_lines=None, content_normalized=None, layout=None,
+                            lines=None):
     """
     Tìm sinh viên với thuật toán cải tiến:
     1. Kiểm tra MSSV chính xác (word boundary)
     2. Ưu tiên dòng có CẢ tên VÀ MSSV
     3. Xử lý nhiều format bảng
     4. Tìm trong vùng lân cận nếu không cùng dòng
+    
+    mssv_lines / content_normalized / lines: kết quả tính sẵn khi tra cứu hàng loạt
+    (chỉ số dòng chứa MSSV từ MssvMatcher, nội dung đã chuẩn hóa hoặc hàm trả về
+    nội dung đã chuẩn hóa - chỉ gọi khi cần, các dòng của doc)
+    layout: kết quả detect_doc_layout của doc; có thì thử trích nhanh theo layout trước
     """
-    content_normalized = normalize_text(content)
     ten_normalized = normalize_text(ten_sv)
     
     # Tách họ tên thành các từ để tìm chính xác hơn
@@ -224,19 +647,42 @@ def find_student_in_content(content, ten_sv, mssv):
     
     # Kiểm tra MSSV với word boundary (tránh match một phần)
     mssv_pattern = re.compile(r'\b' + re.escape(mssv) + r'\b')
-    if not mssv_pattern.search(content):
+    if mssv_lines is None and layout is not None:
+        if mssv.isdigit():
+            mssv_lines = MssvMatcher([mssv]).scan(content).get(mssv, [])
+        elif mssv_pattern.search(content):
+            # MssvMatcher chỉ nhận MSSV toàn số; MSSV có chữ (VD: N21DCCN001) dò từng dòng
+            lines = lines if lines is not None else content.split('\n')
+            mssv_lines = [i for i, line in enumerate(lines) if mssv_pattern.search(line)]
+        else:
+            mssv_lines = []
+    if mssv_lines is None:
+        if not mssv_pattern.search(content):
+            return False, None, None
+    elif not mssv_lines:
         return False, None, None
     
+    if lines is None:
+        lines = content.split('\n')
+    if layout is not None:
+        fast = find_student_with_layout(lines, layout, mssv, ten_normalized, ten_cuoi, mssv_lines)
+        if fast is not None:
+            return True, fast[0], fast[1]
+    
     # Kiểm tra tên có trong content không
+    if content_normalized is None:
+        content_normalized = normalize_text(content)
+    elif callable(content_normalized):
+        content_normalized = content_normalized()
     if ten_normalized not in content_normalized and ten_cuoi not in content_normalized:
         return False, None, None
     
-    lines = content.split('\n')
+    candidate_lines = range(len(lines)) if mssv_lines is None else mssv_lines
     best_result = None
     best_score = 0
     
-    for i, line in enumerate(lines):
-        line_stripped = line.strip()
+    for i in candidate_lines:
+        line_stripped = lines[i].strip()
         if not line_stripped:
             continue
             
@@ -324,8 +770,8 @@ def find_student_in_content(content, ten_sv, mssv):
     
     # Fallback: tìm thấy MSSV nhưng không xác định được chi tiết
     # Kiểm tra lại tên có gần MSSV không
-    for i, line in enumerate(lines):
-        if mssv_pattern.search(line):
+    for i in candidate_lines:
+        if mssv_pattern.search(lines[i]):
             context_start = max(0, i - 3)
             context_end = min(len(lines), i + 4)
             context_text = normalize_text(' '.join(lines[context_start:context_end]))
@@ -335,34 +781,214 @@ def find_student_in_content(content, ten_sv, mssv):
     return False, None, None
 
 
-def process_doc(doc, ten_sv, mssv, session):
+def find_name_in_parts(parts, mssv):
+    """Tìm họ tên trong các cột của dòng bảng"""
+    for part in parts:
+        if RE_NAME.match(part):
+            return part
+    # Dòng tách theo space đơn: ghép các từ chữ cái liền nhau đứng trước MSSV
+    words = []
+    for part in parts:
+        if mssv in part:
+            break
+        if part.isalpha():
+            words.append(part)
+        elif len(words) >= 2:
+            break
+        else:
+            words = []
+    return ' '.join(words) if len(words) >= 2 else None
+
+
+def find_class_in_parts(parts, mssv):
+    for part in parts:
+        if part != mssv and RE_CLASS.match(part):
+            return part
+    return None
+
+
+def extract_student_rows(content, layout=None):
+    """
+    Trích TẤT CẢ các dòng sinh viên (MSSV, tên, lớp, STT, NRL) trong một doc.
+    Dùng cùng heuristics với find_student_in_content: ưu tiên dữ liệu cùng dòng,
+    thiếu thì tìm ở các dòng lân cận (bảng xuất mỗi ô một dòng).
+    
+    Chỉ nhận dòng có cấu trúc bảng: dòng tách được thành cột (tab, |, nhiều khoảng
+    trắng) có STT/NRL ngay trên dòng, hoặc ô MSSV đứng riêng một dòng có STT/NRL ở
+    các dòng lân cận. Số 8-12 chữ số trong câu văn (ghi chú, số điện thoại) bị bỏ qua.
+    layout: kết quả detect_doc_layout; dòng đúng layout bảng thì đọc thẳng các cột
+    """
+    lines = content.split('\n')
+    rows = []
+    table = layout if layout is not None and layout["kind"] == "table" else None
+    
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+        if not line_stripped:
+            continue
+        
+        for mssv in dict.fromkeys(RE_MSSV.findall(line_stripped)):
+            parts = parse_table_row(line_stripped)
+            if table and len(parts) == table["ncols"]:
+                if parts[table["mssv"]] != mssv:
+                    continue  # Số 8-12 chữ số ở cột khác (VD: số điện thoại), không phải MSSV
+                rows.append({
+                    "mssv": mssv,
+                    "name": parts[table["name"]],
+                    "class_name": find_class_in_parts(parts, mssv) or "",
+                    "stt": parse_stt_cell(parts[table["stt"]]),
+                    "nrl": parse_nrl_cell(parts[table["nrl"]]),
+                })
+                continue
+            
+            standalone = line_stripped == mssv
+            tabular = RE_TABLE_ROW.search(line_stripped) is not None
+            if not standalone and not tabular:
+                continue  # MSSV nằm trong câu văn, không phải dòng bảng
+            
+            name = find_name_in_parts(parts, mssv)
+            class_name = find_class_in_parts(parts, mssv)
+            stt = None
+            nrl = None
+            
+            if len(parts) >= 2:
+                stt = find_stt_in_line(line_stripped, mssv)
+                nrl = find_nrl_in_parts(parts, mssv)
+            if tabular and stt is None and nrl is None:
+                continue
+            
+            # Dữ liệu trên nhiều dòng: tên/lớp/STT ở các dòng trước, NRL ở các dòng sau
+            if name is None or class_name is None or stt is None:
+                for offset in range(1, 6):
+                    if i - offset < 0:
+                        break
+                    prev_line = lines[i - offset].strip()
+                    if RE_MSSV.search(prev_line):
+                        break  # Đã sang dòng của sinh viên khác
+                    if name is None and RE_NAME.match(prev_line):
+                        name = prev_line
+                    elif class_name is None and RE_CLASS.match(prev_line):
+                        class_name = prev_line
+                    elif stt is None:
+                        found_stt = find_stt_in_line(prev_line, mssv) if prev_line else None
+                        if found_stt:
+                            stt = found_stt
+                            break
+            
+            if nrl is None:
+                for offset in range(1, 5):
+                    if i + offset >= len(lines):
+                        break
+                    next_line = lines[i + offset].strip().replace(',', '.')
+                    if RE_MSSV.search(next_line):
+                        break
+                    valid, val = is_valid_nrl(next_line)
+                    if valid:
+                        nrl = val
+                        break
+            
+            if stt is None and nrl is None:
+                continue
+            rows.append({
+                "mssv": mssv,
+                "name": name or "",
+                "class_name": class_name or "",
+                "stt": stt,
+                "nrl": nrl,
+            })
+    
+    return rows
+
+
+def process_doc(doc, ten_sv, mssv, session, timings=None):
+    """timings: dict nhận thời gian đọc (fetch) và phân tích (parse) khi profile"""
     link = doc["link"]
-    doc_name = doc["name"]
     
     try:
+        started = time.perf_counter()
         content = read_doc_text(link, session)
+        fetched = time.perf_counter()
+        if timings is not None:
+            timings["fetch"] = fetched - started
         if content is None:
             return None
         
-        found, stt, nrl = find_student_in_content(content, ten_sv, mssv)
+        layout = get_doc_layout(doc, content)
+        found, stt, nrl = find_student_in_content(content, ten_sv, mssv, layout=layout)
+        if timings is not None:
+            timings["parse"] = time.perf_counter() - fetched
         
         if found:
-            short_name = doc_name[:50] + "..." if len(doc_name) > 50 else doc_name
-            return {
-                "link": link,
-                "doc_name": short_name or "File",
-                "stt": stt if stt else "-",
-                "nrl": nrl if nrl is not None else "-",
-            }
+            return make_result(doc, stt, nrl)
         return None
     except Exception as e:
         print(f"[ERROR] {link}: {e}")
         return None
 
 
-def create_excel(results, ten_sv, mssv, total_nrl):
-    output_file = f"ket_qua_{mssv}.xlsx"
+def make_result(doc, stt, nrl):
+    doc_name = doc["name"]
+    short_name = doc_name[:50] + "..." if len(doc_name) > 50 else doc_name
+    return {
+        "link": doc["link"],
+        "doc_name": short_name or "File",
+        "sources": doc.get("sources", []),
+        "stt": stt if stt else "-",
+        "nrl": nrl if nrl is not None else "-",
+    }
+
+
+def find_students_in_content(content, students, matcher, layout=None):
+    """
+    Tra cứu nhiều sinh viên trong một doc: quét MSSV một lượt bằng matcher,
+    chỉ chạy heuristics STT/NRL cho các MSSV thực sự xuất hiện.
+    students: {mssv: ten_sv}. Trả về {mssv: (stt, nrl)}
+    """
+    hits = matcher.scan(content)
+    if not hits:
+        return {}
+    
+    # Doc đã phân loại layout thì phần lớn MSSV trích nhanh: chỉ chuẩn hóa cả doc (một lần)
+    # khi có MSSV phải quay về heuristics chung
+    normalized = []
     
+    def content_normalized():
+        if not normalized:
+            normalized.append(normalize_text(content))
+        return normalized[0]
+    
+    lines = content.split('\n')
+    found_students = {}
+    for mssv, line_numbers in hits.items():
+        found, stt, nrl = find_student_in_content(
+            content, students[mssv], mssv,
+            mssv_lines=line_numbers, content_normalized=content_normalized, layout=layout, lines=lines
+        )
+        if found:
+            found_students[mssv] = (stt, nrl)
+    return found_students
+
+
+def process_doc_batch(doc, students, matcher, session):
+    """Đọc doc MỘT lần và tìm tất cả sinh viên trong batch"""
+    try:
+        content = read_doc_text(doc["link"], session)
+        if content is None:
+            return {}
+        found = find_students_in_content(content, students, matcher, get_doc_layout(doc, content))
+        return {mssv: make_result(doc, stt, nrl) for mssv, (stt, nrl) in found.items()}
+    except Exception as e:
+        print(f"[ERROR] {doc['link']}: {e}")
+        return {}
+
+
+def sort_and_total(results):
+    results.sort(key=lambda x: (x["stt"] if isinstance(x["stt"], int) else 9999))
+    return sum(r["nrl"] for r in results if isinstance(r["nrl"], (int, float)))
+
+
+def create_excel(results, ten_sv, mssv, total_nrl):
+    """Tạo file Excel báo cáo trong bộ nhớ, trả về bytes"""
     wb_out = Workbook()
     ws_out = wb_out.active
     ws_out.title = "Ket qua NRL"
@@ -419,9 +1045,200 @@ def create_excel(results, ten_sv, mssv, total_nrl):
     ws_out.column_dimensions['D'].width = 50
     ws_out.column_dimensions['E'].width = 60
     
-    wb_out.save(output_file)
-    print(f"[INFO] Created: {output_file}")
-    return output_file
+    output = io.BytesIO()
+    wb_out.save(output)
+    print(f"[INFO] Created Excel for {mssv}")
+    return output.getvalue()
+
+
+def roster_path(name):
+    return os.path.join(ROSTER_DIR, name)
+
+
+def claim_roster_build():
+    """Nhiều process: chỉ một process build roster tại một thời điểm (file đánh dấu)"""
+    os.makedirs(ROSTER_DIR, exist_ok=True)
+    marker = roster_path("roster.building")
+    try:
+        if time.time() - os.path.getmtime(marker) > ROSTER_BUILD_TIMEOUT:
+            os.remove(marker)
+    except OSError:
+        pass
+    try:
+        fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.write(fd, str(os.getpid()).encode())
+    os.close(fd)
+    return True
+
+
+def release_roster_build():
+    try:
+        os.remove(roster_path("roster.building"))
+    except OSError:
+        pass
+
+
+def is_roster_building():
+    """Process này hoặc (ROSTER_DIR) process khác đang build roster"""
+    if _roster_building or not ROSTER_DIR:
+        return _roster_building
+    try:
+        return time.time() - os.path.getmtime(roster_path("roster.building")) <= ROSTER_BUILD_TIMEOUT
+    except OSError:
+        return False
+
+
+def load_shared_roster():
+    """ROSTER_DIR: nạp lại roster khi file snapshot được process khác ghi mới"""
+    global _roster, _roster_mtime
+    if not ROSTER_DIR:
+        return _roster
+    path = roster_path("roster.json")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return _roster
+    if mtime == _roster_mtime:
+        return _roster
+    with _roster_lock:
+        if mtime != _roster_mtime:
+            try:
+                _roster = load_snapshot(path, normalize=normalize_text)
+                print(f"[INFO] Roster: nap snapshot {_roster.built_at}, {len(_roster)} sinh vien")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[ERROR] Roster snapshot: {e}")
+            _roster_mtime = mtime
+    return _roster
+
+
+def build_roster():
+    """
+    Quét toàn bộ corpus MỘT lần, trích mọi dòng sinh viên và build roster dạng cột.
+    ROSTER_DIR: process khác đang build thì bỏ qua; build xong ghi snapshot cho các process khác
+    """
+    global _roster, _roster_building, _roster_mtime
+    with _roster_lock:
+        if _roster_building or (ROSTER_DIR and not claim_roster_build()):
+            return _roster
+        _roster_building = True
+    
+    try:
+        docs = get_doc_links()
+        session = create_session()
+        rows = []
+        started = datetime.now()
+        
+        unreadable = []
+        
+        def fetch_rows(doc_idx, doc):
+            content = read_doc_text(doc["link"], session)
+            if content is None:
+                unreadable.append(doc_idx)
+                return []
+            doc_rows = extract_student_rows(content, get_doc_layout(doc, content))
+            for r in doc_rows:
+                r["doc_idx"] = doc_idx
+            return doc_rows
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [executor.submit(fetch_rows, i, doc) for i, doc in enumerate(docs)]
+            for future in as_completed(futures):
+                try:
+                    rows.extend(future.result())
+                except Exception as e:
+                    print(f"[ERROR] Roster: {e}")
+        
+        roster = RosterTable(rows, docs, normalize=normalize_text, unreadable=unreadable)
+        if ROSTER_DIR:
+            path = roster_path("roster.json")
+            save_snapshot(path, rows, roster)
+            _roster_mtime = os.stat(path).st_mtime_ns
+        _roster = roster
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[INFO] Roster: {len(roster)} sinh vien, {roster.total_rows} dong, {elapsed:.1f}s")
+        if _refresher_running:
+            events = _change_feed.update(roster)
+            if events:
+                print(f"[INFO] Changes: {len(events)} su kien moi")
+        return roster
+    finally:
+        _roster_building = False
+        if ROSTER_DIR:
+            release_roster_build()
+
+
+def run_refresher(stop_event=None):
+    """
+    Vòng làm mới định kỳ: đọc lại registry, build lại roster, ghi sự kiện thay đổi.
+    Chỉ MỘT process được chạy vòng này (thread nền khi chạy 1 process, process riêng
+    do launcher fork khi nhiều worker) vì mọi sự kiện ghi vào cùng một nguồn.
+    """
+    global _refresher_running
+    _refresher_running = True
+    stop_event = stop_event or threading.Event()
+    print(f"[INFO] Refresh moi {REFRESH_INTERVAL}s, {_change_feed.count()} dang ky")
+    try:
+        # Lần đầu chỉ làm mốc so sánh (roster nạp sẵn khi warm-up / snapshot nếu có)
+        roster = load_shared_roster()
+        if roster is not None:
+            _change_feed.update(roster)
+        else:
+            build_roster()
+    except Exception as e:
+        print(f"[ERROR] Refresh: {e}")
+    
+    while not stop_event.wait(REFRESH_INTERVAL):
+        try:
+            get_doc_links(reload=True)
+            build_roster()
+        except Exception as e:
+            print(f"[ERROR] Refresh: {e}")
+
+
+def start_refresher():
+    """Chạy vòng làm mới trong thread nền nếu bật REFRESH_INTERVAL"""
+    if REFRESH_INTERVAL <= 0 or _refresher_running:
+        return None
+    thread = threading.Thread(target=run_refresher, daemon=True)
+    thread.start()
+    return thread
+
+
+def is_admin_request():
+    """Có ADMIN_TOKEN: yêu cầu header X-Admin-Token hoặc ?token=. Không có: chỉ cho máy local"""
+    if ADMIN_TOKEN:
+        token = request.headers.get('X-Admin-Token') or request.args.get('token', '')
+        return token == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+def get_roster_or_error():
+    """Trả về (roster, None) hoặc (None, response lỗi); roster chưa có thì build nền"""
+    if not is_admin_request():
+        return None, (jsonify({"error": "Khong co quyen truy cap"}), 403)
+    roster = load_shared_roster()
+    if roster is None:
+        if not is_roster_building():
+            threading.Thread(target=build_roster, daemon=True).start()
+        return None, (jsonify({"error": "Roster dang duoc tong hop, thu lai sau", "building": True}), 503)
+    return roster, None
+
+
+def parse_float_param(name):
+    value = request.args.get(name, '').strip()
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_int_param(name, default):
+    try:
+        return int(request.values.get(name, default))
+    except ValueError:
+        return default
 
 
 @app.route('/')
@@ -432,11 +1249,19 @@ def index():
 @app.route('/health')
 def health():
     docs = get_doc_links()
+    excel_files = get_excel_files()
     return jsonify({
         "status": "ok",
         "excel_file": EXCEL_FILE,
-        "excel_exists": os.path.exists(EXCEL_FILE),
-        "total_docs": len(docs)
+        "excel_files": excel_files,
+        "excel_exists": any(os.path.exists(f) for f in excel_files),
+        "total_docs": len(docs),
+        "sources": count_docs_by_source(docs),
+        "offline_corpus": OFFLINE_CORPUS or None,
+        "offline_docs": len(get_offline_corpus()),
+        "doc_layouts": count_doc_layouts(),
+        "refresh_interval": REFRESH_INTERVAL,
+        "changes_last_id": _change_feed.last_id
     })
 
 
@@ -449,80 +1274,401 @@ def search():
         if not ten_sv or not mssv:
             return jsonify({"error": "Vui long nhap ca ten VA MSSV"})
         
+        # Giới hạn phạm vi tìm kiếm theo nguồn (VD: sources=nrl_hk1,nrl_hk2/CNTT)
+        sources = parse_sources_param(request.form.get('sources'))
+        
         unique_docs = get_doc_links()
         
         if not unique_docs:
             return jsonify({"error": "Khong tim thay file Excel hoac file rong"})
         
-        results = []
-        
-        session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(
-            pool_connections=MAX_WORKERS,
-            pool_maxsize=MAX_WORKERS
-        )
-        session.mount('https://', adapter)
-        session.headers.update({"User-Agent": "Mozilla/5.0"})
+        unique_docs = filter_docs_by_source(unique_docs, sources)
+        if not unique_docs:
+            return jsonify({"error": "Khong co file nao thuoc nguon da chon"})
         
-        print(f"[INFO] Scanning {len(unique_docs)} files for {ten_sv} - {mssv}")
+        # Profile request (quản trị): header X-Profile: 1 hoặc tham số profile=1
+        profiler = None
+        if request.headers.get('X-Profile') == '1' or request.values.get('profile') == '1':
+            if not is_admin_request():
+                return jsonify({"error": "Khong co quyen truy cap"}), 403
+            profiler = RequestProfiler()
+            if not profiler.start():
+                return jsonify({"error": "Dang co request khac duoc profile, thu lai sau"}), 429
         
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {
-                executor.submit(process_doc, doc, ten_sv, mssv, session): doc 
-                for doc in unique_docs
-            }
+        results = []
+        try:
+            session = create_session()
+            worker = profiler.wrap(process_doc) if profiler else process_doc
+            timings = {doc["link"]: {} for doc in unique_docs} if profiler else {}
             
-            try:
-                for future in as_completed(futures, timeout=25):
-                    try:
-                        result = future.result(timeout=1)
-                        if result:
-                            results.append(result)
-                    except:
-                        pass
-            except:
-                pass
+            print(f"[INFO] Scanning {len(unique_docs)} files for {ten_sv} - {mssv}")
+            
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                futures = {
+                    executor.submit(worker, doc, ten_sv, mssv, session, timings.get(doc["link"])): doc 
+                    for doc in unique_docs
+                }
+                
+                try:
+                    for future in as_completed(futures, timeout=25):
+                        try:
+                            result = future.result(timeout=1)
+                            if result:
+                                results.append(result)
+                        except:
+                            pass
+                except:
+                    pass
+        finally:
+            if profiler:
+                profiler.stop()
         
-        results.sort(key=lambda x: (x["stt"] if isinstance(x["stt"], int) else 9999))
-        total_nrl = sum(r["nrl"] for r in results if isinstance(r["nrl"], (int, float)))
+        total_nrl = sort_and_total(results)
         
         print(f"[INFO] Found {len(results)} results, total NRL: {total_nrl}")
         
-        return jsonify({
+        response = {
             "results": results,
             "total_nrl": total_nrl,
             "total_files": len(results),
             "ten_sv": ten_sv,
             "mssv": mssv
-        })
+        }
+        response["result_id"] = _result_store.put(dict(response))
+        if profiler:
+            response["profile"] = build_profile_report(profiler, unique_docs, timings, results, mssv)
+        return jsonify(response)
     except Exception as e:
         print(f"[ERROR] Search failed: {e}")
         return jsonify({"error": f"Loi server: {str(e)}"}), 500
 
 
-@app.route('/download', methods=['POST'])
+def build_profile_report(profiler, docs, timings, results, mssv):
+    """Báo cáo profile: top hàm, N doc chậm nhất (fetch/parse), tùy chọn lưu file .prof"""
+    found_links = {r["link"] for r in results}
+    for doc in docs:
+        profiler.record_doc(doc, timings[doc["link"]], doc["link"] in found_links)
+    
+    report = profiler.report(
+        top=parse_int_param('profile_top', 20),
+        slow_docs=parse_int_param('profile_docs', 10),
+    )
+    if request.values.get('profile_save') == '1':
+        safe_mssv = re.sub(r'\W', '_', mssv)[:20]
+        filename = f"search_{safe_mssv}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof"
+        report["prof_file"] = profiler.dump(os.path.join(PROFILE_DIR, filename))
+    return report
+
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Tra cứu hàng loạt (quản trị): mỗi doc chỉ đọc và quét MSSV một lần cho cả danh sách.
+    Body JSON: {"students": [{"ten_sv": "...", "mssv": "..."}], "sources": "nrl_hk1,..."}
+    """
+    if not is_admin_request():
+        return jsonify({"error": "Khong co quyen truy cap"}), 403
+    try:
+        data = request.get_json(silent=True) or {}
+        students = {}
+        for item in data.get('students', []):
+            ten_sv = str(item.get('ten_sv', '')).strip()
+            mssv = str(item.get('mssv', '')).strip()
+            if ten_sv and mssv.isdigit():
+                students[mssv] = ten_sv
+        
+        if not students:
+            return jsonify({"error": "Danh sach sinh vien rong hoac khong hop le"}), 400
+        if len(students) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Toi da {MAX_BATCH_SIZE} sinh vien moi lan"}), 400
+        
+        unique_docs = filter_docs_by_source(get_doc_links(), parse_sources_param(data.get('sources')))
+        if not unique_docs:
+            return jsonify({"error": "Khong tim thay file Excel hoac file rong"})
+        
+        matcher = MssvMatcher(students.keys())
+        session = create_session()
+        results = {mssv: [] for mssv in students}
+        
+        print(f"[INFO] Batch: {len(students)} sinh vien x {len(unique_docs)} files")
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(process_doc_batch, doc, students, matcher, session)
+                for doc in unique_docs
+            ]
+            for future in as_completed(futures):
+                try:
+                    for mssv, result in future.result().items():
+                        results[mssv].append(result)
+                except Exception as e:
+                    print(f"[ERROR] Batch: {e}")
+        
+        response = []
+        for mssv, ten_sv in students.items():
+            student_results = results[mssv]
+            total_nrl = sort_and_total(student_results)
+            response.append({
+                "ten_sv": ten_sv,
+                "mssv": mssv,
+                "results": student_results,
+                "total_nrl": total_nrl,
+                "total_files": len(student_results),
+            })
+        
+        return jsonify({"students": response, "total_docs": len(unique_docs)})
+    except Exception as e:
+        print(f"[ERROR] Batch search failed: {e}")
+        return jsonify({"error": f"Loi server: {str(e)}"}), 500
+
+
+def render_excel(data):
+    return create_excel(data["results"], data["ten_sv"], data["mssv"], data["total_nrl"])
+
+
+# Định dạng xuất: format -> (hàm tạo bytes, mimetype, phần mở rộng)
+EXPORT_FORMATS = {
+    "xlsx": (render_excel, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+
+@app.route('/download', methods=['GET', 'POST'])
 def download():
+    """Tải kết quả đã lưu phía server theo result_id (không nhận lại results từ client)"""
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Khong co du lieu"}), 400
-            
-        results = data.get('results', [])
-        ten_sv = data.get('ten_sv', '')
-        mssv = data.get('mssv', '')
-        total_nrl = data.get('total_nrl', 0)
+        data = request.get_json(silent=True) or {}
+        result_id = data.get('result_id') or request.values.get('result_id', '')
+        fmt = data.get('format') or request.values.get('format', 'xlsx')
         
-        if not results:
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": "Dinh dang khong ho tro"}), 400
+        
+        stored = _result_store.get(result_id)
+        if stored is None:
+            return jsonify({"error": "Ket qua da het han, vui long tra cuu lai"}), 404
+        if not stored["results"]:
             return jsonify({"error": "Khong co ket qua de tai"}), 400
         
-        excel_file = create_excel(results, ten_sv, mssv, total_nrl)
-        return send_file(excel_file, as_attachment=True)
+        render, mimetype, ext = EXPORT_FORMATS[fmt]
+        content = _result_store.get_export(result_id, fmt, render)
+        return send_file(
+            io.BytesIO(content),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f"ket_qua_{stored['mssv']}.{ext}"
+        )
     except Exception as e:
         print(f"[ERROR] Download failed: {e}")
         return jsonify({"error": f"Loi tao file: {str(e)}"}), 500
 
 
+@app.route('/roster')
+def roster_list():
+    roster, error = get_roster_or_error()
+    if error:
+        return error
+    
+    sort = request.args.get('sort', 'mssv')
+    desc = sort.startswith('-')
+    return jsonify(roster.query(
+        q=request.args.get('q', '').strip(),
+        class_name=request.args.get('class', '').strip(),
+        cohort=request.args.get('cohort', '').strip(),
+        min_nrl=parse_float_param('min_nrl'),
+        max_nrl=parse_float_param('max_nrl'),
+        conflicts_only=request.args.get('conflicts') == '1',
+        sort=sort.lstrip('-'),
+        desc=desc,
+        page=parse_int_param('page', 1),
+        page_size=parse_int_param('page_size', 50),
+    ))
+
+
+@app.route('/roster/stats')
+def roster_stats():
+    roster, error = get_roster_or_error()
+    if error:
+        return error
+    stats = roster.stats()
+    stats["leaderboard"] = roster.leaderboard(parse_int_param('top', 10))
+    return jsonify(stats)
+
+
+@app.route('/roster/issues')
+def roster_issues():
+    """Các dòng trùng lặp / mâu thuẫn NRL / MSSV có nhiều tên khác nhau"""
+    roster, error = get_roster_or_error()
+    if error:
+        return error
+    issue_type = request.args.get('type', '')
+    issues = [x for x in roster.issues if not issue_type or x["type"] == issue_type]
+    return jsonify({"total": len(issues), "issues": issues})
+
+
+@app.route('/roster/<mssv>')
+def roster_student(mssv):
+    roster, error = get_roster_or_error()
+    if error:
+        return error
+    student = roster.get_student(mssv)
+    if student is None:
+        return jsonify({"error": "Khong tim thay MSSV trong roster"}), 404
+    student["docs"] = roster.student_docs(mssv)
+    return jsonify(student)
+
+
+@app.route('/roster/rebuild', methods=['POST'])
+def roster_rebuild():
+    if not is_admin_request():
+        return jsonify({"error": "Khong co quyen truy cap"}), 403
+    if is_roster_building():
+        return jsonify({"status": "building"}), 202
+    threading.Thread(target=build_roster, daemon=True).start()
+    return jsonify({"status": "started"}), 202
+
+
+def subscription_matcher(sub):
+    """
+    Lọc sự kiện cho một đăng ký: tên trên CHÍNH dòng của doc phải khớp như /search
+    (họ tên hoặc tên riêng); dòng không ghi tên thì chỉ cần khớp MSSV
+    """
+    ten_normalized = normalize_text(sub.get("ten_sv", ""))
+    ten_parts = ten_normalized.split()
+    ten_cuoi = ten_parts[-1] if ten_parts else ten_normalized
+    
+    def match(event):
+        name = normalize_text(event.get("name") or "")
+        return not name or ten_normalized in name or ten_cuoi in name
+    return match
+
+
+def get_feed_scope():
+    """
+    (mssv, match, None) cho ?subscription=<id> (đồng thời gia hạn đăng ký), cả nguồn
+    sự kiện cho quản trị viên; hoặc (None, None, response lỗi)
+    """
+    subscription_id = request.args.get('subscription', '')
+    if not subscription_id:
+        if not is_admin_request():
+            return None, None, (jsonify({"error": "Thieu subscription"}), 400)
+        return None, None, None
+    sub = _change_feed.get_subscription(subscription_id)
+    if sub is None:
+        return None, None, (jsonify({"error": "Dang ky khong ton tai hoac da het han"}), 404)
+    _change_feed.touch(subscription_id)
+    if sub["mssv"] == ALL:
+        return None, None, None
+    return sub["mssv"], subscription_matcher(sub), None
+
+
+def parse_since():
+    """Vị trí đã đọc: ?since= hoặc header Last-Event-ID (EventSource tự gửi khi kết nối lại)"""
+    value = request.args.get('since') or request.headers.get('Last-Event-ID', '0')
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+@app.route('/subscriptions', methods=['POST'])
+def subscribe():
+    """Đăng ký theo dõi một MSSV (cần tên như /search); quản trị viên: roster=true cho cả roster"""
+    data = request.get_json(silent=True) or {}
+    ten_sv = str(data.get('ten_sv') or request.values.get('ten_sv', '')).strip()
+    mssv = str(data.get('mssv') or request.values.get('mssv', '')).strip()
+    roster_wide = str(data.get('roster') or request.values.get('roster', '')).lower() in ('1', 'true')
+    
+    if roster_wide:
+        if not is_admin_request():
+            return jsonify({"error": "Khong co quyen truy cap"}), 403
+        mssv = ALL
+    elif not ten_sv or not mssv:
+        return jsonify({"error": "Vui long nhap ca ten VA MSSV"}), 400
+    elif not RE_MSSV.fullmatch(mssv):
+        return jsonify({"error": "MSSV khong hop le"}), 400
+    
+    if _change_feed.count() >= MAX_SUBSCRIPTIONS:
+        return jsonify({"error": "Qua nhieu dang ky, thu lai sau"}), 503
+    
+    subscription_id = _change_feed.subscribe(mssv, ten_sv)
+    return jsonify({
+        "subscription_id": subscription_id,
+        "mssv": mssv,
+        "last_id": _change_feed.last_id,
+        "refresh_interval": REFRESH_INTERVAL,
+        "ttl": SUBSCRIPTION_TTL,
+    }), 201
+
+
+@app.route('/subscriptions/<subscription_id>', methods=['DELETE'])
+def unsubscribe(subscription_id):
+    if not _change_feed.unsubscribe(subscription_id):
+        return jsonify({"error": "Dang ky khong ton tai"}), 404
+    return jsonify({"status": "deleted"})
+
+
+@app.route('/changes')
+def changes():
+    """
+    Sự kiện thay đổi sau ?since=<id>. ?wait=<giây>: long-poll, giữ kết nối đến khi có
+    sự kiện (tối đa CHANGES_MAX_WAIT); hết chỗ chờ thì trả ngay kết quả hiện có.
+    """
+    mssv, match, error = get_feed_scope()
+    if error:
+        return error
+    since_id = parse_since()
+    limit = max(1, min(parse_int_param('limit', 500), 500))
+    try:
+        wait = min(max(0.0, float(request.args.get('wait', 0))), CHANGES_MAX_WAIT)
+    except ValueError:
+        wait = 0.0
+    
+    if wait and _change_waiters.acquire(blocking=False):
+        try:
+            return jsonify(_change_feed.poll(since_id, mssv, match, timeout=wait, limit=limit))
+        finally:
+            _change_waiters.release()
+    return jsonify(_change_feed.since(since_id, mssv, match, limit=limit))
+
+
+@app.route('/changes/stream')
+def changes_stream():
+    """
+    Server-Sent Events: đẩy sự kiện ngay khi có. Mỗi kết nối giữ tối đa CHANGES_MAX_WAIT
+    giây, EventSource tự kết nối lại kèm Last-Event-ID nên không mất sự kiện.
+    """
+    mssv, match, error = get_feed_scope()
+    if error:
+        return error
+    if not _change_waiters.acquire(blocking=False):
+        return jsonify({"error": "Qua nhieu ket noi, thu lai sau"}), 503, {"Retry-After": "5"}
+    since_id = parse_since()
+    
+    def generate():
+        nonlocal since_id
+        yield "retry: 3000\n\n"
+        deadline = time.monotonic() + CHANGES_MAX_WAIT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            result = _change_feed.poll(since_id, mssv, match, timeout=min(remaining, 15))
+            if result["reset"]:
+                yield f"event: reset\ndata: {json.dumps({'last_id': result['last_id']})}\n\n"
+            for event in result["events"]:
+                yield f"id: {event['id']}\nevent: change\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if not result["events"] and not result["reset"]:
+                yield ": ping\n\n"  # Giữ kết nối, phát hiện client đã đóng
+            since_id = result["last_id"]
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(_change_waiters.release)
+    return response
+
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     debug = os.environ.get("DEBUG", "false").lower() == "true"
+    start_refresher()
     app.run(host='0.0.0.0', port=port, debug=debug)
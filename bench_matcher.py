@@ -0,0 +1,164 @@
+"""
+Benchmark quét MSSV: regex riêng cho từng MSSV vs MssvMatcher (một lượt cho cả tập)
+
+Cách dùng:
+    python bench_matcher.py                    # 1, 100, 10000 MSSV trên doc 5000 dòng
+    python bench_matcher.py --rows 2000 --sizes 1 100 1000
+
+So sánh 3 cách:
+  - regex:   compile \\b<mssv>\\b cho từng MSSV, kiểm tra content rồi từng dòng
+             (cách find_student_in_content đang làm khi gọi lặp theo từng MSSV)
+  - aho:     automaton Aho-Corasick viết bằng Python thuần (tham chiếu)
+  - matcher: MssvMatcher - quét token số bằng regex đã compile + tra hash set
+"""
+import argparse
+import random
+import re
+import time
+from collections import deque
+
+from matcher import MssvMatcher
+
+
+def generate_doc(rows, seed=1):
+    """Sinh doc dạng bảng tab với `rows` sinh viên, trả về (content, danh sách MSSV)"""
+    rnd = random.Random(seed)
+    ho = ["Nguyen", "Tran", "Le", "Pham", "Hoang", "Vo", "Dang", "Bui"]
+    dem = ["Van", "Thi", "Minh", "Ngoc", "Thanh", "Hoang"]
+    ten = ["An", "Binh", "Cuong", "Dung", "Giang", "Huong", "Khanh", "Linh"]
+    lines = ["DANH SACH SINH VIEN THAM GIA", "STT\tHo va ten\tLop\tMSSV\tNRL"]
+    mssv_list = []
+    for i in range(1, rows + 1):
+        mssv = f"{rnd.randint(20, 25)}{rnd.randint(10000000, 99999999)}"
+        mssv_list.append(mssv)
+        name = f"{rnd.choice(ho)} {rnd.choice(dem)} {rnd.choice(ten)}"
+        lines.append(f"{i}\t{name}\tD{mssv[:2]}_TH0{rnd.randint(1, 9)}\t{mssv}\t{rnd.randint(1, 5)}")
+    return '\n'.join(lines), mssv_list
+
+
+def pick_patterns(mssv_list, size, seed=2):
+    """Một nửa có trong doc, một nửa không (giống tra cứu hàng loạt thực tế)"""
+    rnd = random.Random(seed)
+    present = rnd.sample(mssv_list, min(len(mssv_list), (size + 1) // 2))
+    absent = [f"99{rnd.randint(10000000, 99999999)}" for _ in range(size - len(present))]
+    return present + absent
+
+
+def scan_regex(content, patterns):
+    lines = content.split('\n')
+    hits = {}
+    for mssv in patterns:
+        mssv_pattern = re.compile(r'\b' + re.escape(mssv) + r'\b')
+        if not mssv_pattern.search(content):
+            continue
+        for i, line in enumerate(lines):
+            if mssv_pattern.search(line.strip()):
+                hits.setdefault(mssv, []).append(i)
+    return hits
+
+
+def is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class AhoCorasick:
+    """Aho-Corasick tối giản (Python thuần), giữ điều kiện \\b như regex"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [None]
+        for p in patterns:
+            node = 0
+            for ch in p:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(None)
+                node = nxt
+            self.out[node] = p
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+
+    def scan(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        hits = {}
+        node = 0
+        line_no = 0
+        n = len(text)
+        for pos, ch in enumerate(text):
+            if ch == '\n':
+                line_no += 1
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            f = node
+            while f:
+                p = out[f]
+                if p is not None:
+                    start = pos - len(p) + 1
+                    before_ok = start == 0 or not is_word_char(text[start - 1])
+                    after_ok = pos + 1 == n or not is_word_char(text[pos + 1])
+                    if before_ok and after_ok:
+                        lines = hits.setdefault(p, [])
+                        if not lines or lines[-1] != line_no:
+                            lines.append(line_no)
+                f = fail[f]
+        return hits
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quet MSSV")
+    parser.add_argument("--rows", type=int, default=5000, help="So dong sinh vien trong doc")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content, mssv_list = generate_doc(args.rows)
+    size_mb = len(content.encode('utf-8')) / 1024 / 1024
+    print(f"Doc: {args.rows} dong, {size_mb:.2f} MB")
+    print(f"{'MSSV':>7} | {'regex':>10} | {'aho (py)':>10} | {'matcher':>10} | {'build':>8} | speedup")
+    print("-" * 72)
+
+    for size in args.sizes:
+        patterns = pick_patterns(mssv_list, size)
+
+        # regex theo từng MSSV chậm tuyến tính theo số MSSV: chạy 1 lần khi tập lớn
+        t_regex, hits_regex = timed(lambda: scan_regex(content, patterns), 1 if size > 100 else args.repeat)
+
+        ac = AhoCorasick(patterns)
+        t_ac, hits_ac = timed(lambda: ac.scan(content), args.repeat)
+
+        build_start = time.perf_counter()
+        matcher = MssvMatcher(patterns)
+        t_build = time.perf_counter() - build_start
+        t_matcher, hits_matcher = timed(lambda: matcher.scan(content), args.repeat)
+
+        assert hits_regex == hits_matcher == hits_ac, "Ket qua cac phuong phap khong khop!"
+
+        print(f"{size:>7} | {t_regex * 1000:>8.1f}ms | {t_ac * 1000:>8.1f}ms | "
+              f"{t_matcher * 1000:>8.1f}ms | {t_build * 1000:>6.1f}ms | x{t_regex / t_matcher:.0f}")
+
+
+if __name__ == '__main__':
+    main()
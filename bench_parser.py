@@ -0,0 +1,273 @@
+"""
+Benchmark parser: tốc độ và độ chính xác của find_student_in_content
+
+Cách dùng:
+    python bench_parser.py                    # chạy và so sánh với baseline (nếu có)
+    python bench_parser.py --save-baseline    # lưu kết quả hiện tại làm baseline
+    python bench_parser.py --layouts tab vertical --queries 10
+    python bench_parser.py --no-layout        # chỉ dùng heuristics chung (không phân loại layout)
+
+Corpus gồm:
+  - Các doc mẫu trong bench_corpus/ (đáp án trong bench_corpus/golden.json)
+  - Các doc sinh tự động theo từng layout: tab, pipe, nhiều khoảng trắng,
+    mỗi ô một dòng (vertical) và doc rất lớn 5000 dòng (huge)
+
+Chỉ đo phần parser (nội dung đã nằm sẵn trong bộ nhớ, không gọi mạng).
+Mặc định mỗi doc được phân loại layout một lần như khi chạy thật (thời gian phân
+loại tính vào tổng), các truy vấn sau dùng layout đã cache.
+Precision/recall tính riêng cho STT và NRL so với đáp án; các truy vấn
+"absent" (MSSV không có trong doc hoặc sai tên) dùng để đo nhận nhầm.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from app import detect_doc_layout, find_student_in_content
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_corpus")
+GOLDEN_FILE = os.path.join(CORPUS_DIR, "golden.json")
+BASELINE_FILE = os.path.join(CORPUS_DIR, "baseline.json")
+
+# Giảm quá ngưỡng này so với baseline thì báo regression
+ACCURACY_TOLERANCE = 0.001
+THROUGHPUT_TOLERANCE = 0.25
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Võ", "Đặng", "Bùi", "Đỗ", "Ngô"]
+DEM = ["Văn", "Thị", "Minh", "Ngọc", "Thanh", "Hoàng", "Quốc", "Thu"]
+TEN = ["An", "Bình", "Cường", "Dũng", "Giang", "Hương", "Khánh", "Linh", "Nam", "Tâm"]
+
+
+# =====================
+# SINH CORPUS
+# =====================
+def make_students(n, rnd):
+    students = []
+    seen = set()
+    for stt in range(1, n + 1):
+        mssv = f"{rnd.randint(20, 25)}{rnd.randint(10000000, 99999999)}"
+        while mssv in seen:
+            mssv = f"{rnd.randint(20, 25)}{rnd.randint(10000000, 99999999)}"
+        seen.add(mssv)
+        students.append({
+            "stt": stt,
+            "ten_sv": f"{rnd.choice(HO)} {rnd.choice(DEM)} {rnd.choice(TEN)}",
+            "lop": f"D{mssv[:2]}_TH0{rnd.randint(1, 9)}",
+            "mssv": mssv,
+            "nrl": rnd.choice([1, 2, 3, 4, 5, 1.5, 2.5]),
+        })
+    return students
+
+
+def fmt_nrl(nrl, rnd):
+    text = f"{nrl:g}"
+    return text.replace('.', ',') if rnd.random() < 0.3 else text
+
+
+def layout_tab(students, rnd):
+    lines = ["DANH SÁCH SINH VIÊN", "STT\tHọ và tên\tLớp\tMSSV\tNRL"]
+    for s in students:
+        lines.append(f"{s['stt']}\t{s['ten_sv']}\t{s['lop']}\t{s['mssv']}\t{fmt_nrl(s['nrl'], rnd)}")
+    return '\n'.join(lines)
+
+
+def layout_pipe(students, rnd):
+    lines = ["DANH SÁCH SINH VIÊN", "| STT | Họ và tên | Lớp | MSSV | NRL |"]
+    for s in students:
+        lines.append(f"| {s['stt']} | {s['ten_sv']} | {s['lop']} | {s['mssv']} | {fmt_nrl(s['nrl'], rnd)} |")
+    return '\n'.join(lines)
+
+
+def layout_spaces(students, rnd):
+    lines = ["DANH SÁCH SINH VIÊN", f"{'STT':<6}{'Họ và tên':<26}{'Lớp':<12}{'MSSV':<14}NRL"]
+    for s in students:
+        stt = f"{s['stt']}." if rnd.random() < 0.5 else str(s['stt'])
+        lines.append(f"{stt:<6}{s['ten_sv']:<26}{s['lop']:<12}{s['mssv']:<14}{fmt_nrl(s['nrl'], rnd)}")
+    return '\n'.join(lines)
+
+
+def layout_vertical(students, rnd):
+    lines = ["DANH SÁCH SINH VIÊN", "STT", "Họ và tên", "Lớp", "MSSV", "NRL"]
+    for s in students:
+        lines += [str(s['stt']), s['ten_sv'], s['lop'], s['mssv'], fmt_nrl(s['nrl'], rnd)]
+    return '\n'.join(lines)
+
+
+# layout -> (hàm sinh, số doc, số dòng mỗi doc)
+GENERATED_LAYOUTS = {
+    "tab": (layout_tab, 20, 60),
+    "pipe": (layout_pipe, 20, 60),
+    "spaces": (layout_spaces, 20, 60),
+    "vertical": (layout_vertical, 20, 60),
+    "huge": (layout_tab, 2, 5000),
+}
+
+
+def generated_corpus(layout, queries, seed=42):
+    """Trả về list (content, [(ten_sv, mssv, stt, nrl)], [(ten_sv, mssv)])"""
+    build, n_docs, n_rows = GENERATED_LAYOUTS[layout]
+    rnd = random.Random(f"{seed}-{layout}")
+    docs = []
+    for _ in range(n_docs):
+        students = make_students(n_rows, rnd)
+        content = build(students, rnd)
+        picked = rnd.sample(students, min(queries, len(students)))
+        present = []
+        for s in picked:
+            # Người dùng thường gõ tên không dấu
+            ten = s["ten_sv"]
+            if rnd.random() < 0.5:
+                ten = ten.lower()
+            present.append((ten, s["mssv"], s["stt"], s["nrl"]))
+        absent = [(picked[0]["ten_sv"], f"99{rnd.randint(10000000, 99999999)}")]
+        docs.append((content, present, absent))
+    return docs
+
+
+def curated_corpus():
+    with open(GOLDEN_FILE, encoding='utf-8') as f:
+        golden = json.load(f)
+    docs = []
+    for filename, spec in golden.items():
+        with open(os.path.join(CORPUS_DIR, filename), encoding='utf-8') as f:
+            content = f.read()
+        present = [(s["ten_sv"], s["mssv"], s["stt"], s["nrl"]) for s in spec["students"]]
+        absent = [(s["ten_sv"], s["mssv"]) for s in spec.get("absent", [])]
+        docs.append((content, present, absent))
+    return docs
+
+
+# =====================
+# ĐO
+# =====================
+def score(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return round(precision, 4), round(recall, 4)
+
+
+def run_layout(docs, use_layout=True):
+    calls = 0
+    total_bytes = 0
+    elapsed = 0.0
+    classified = 0
+    counts = {field: {"tp": 0, "fp": 0, "fn": 0} for field in ("found", "stt", "nrl")}
+    errors = []
+
+    for content, present, absent in docs:
+        size = len(content.encode('utf-8'))
+        layout = None
+        if use_layout:
+            start = time.perf_counter()
+            layout = detect_doc_layout(content)
+            elapsed += time.perf_counter() - start
+            classified += layout is not None
+        for ten_sv, mssv, stt, nrl in present:
+            start = time.perf_counter()
+            found, got_stt, got_nrl = find_student_in_content(content, ten_sv, mssv, layout=layout)
+            elapsed += time.perf_counter() - start
+            calls += 1
+            total_bytes += size
+
+            counts["found"]["tp" if found else "fn"] += 1
+            for field, want, got in (("stt", stt, got_stt), ("nrl", nrl, got_nrl)):
+                if got is not None and got == want:
+                    counts[field]["tp"] += 1
+                else:
+                    counts[field]["fn"] += 1
+                    if got is not None:
+                        counts[field]["fp"] += 1
+                    if len(errors) < 5:
+                        errors.append(f"{mssv} {field}: mong doi {want}, nhan {got}")
+
+        for ten_sv, mssv in absent:
+            start = time.perf_counter()
+            found, got_stt, got_nrl = find_student_in_content(content, ten_sv, mssv, layout=layout)
+            elapsed += time.perf_counter() - start
+            calls += 1
+            total_bytes += size
+            if found:
+                counts["found"]["fp"] += 1
+                if got_stt is not None:
+                    counts["stt"]["fp"] += 1
+                if got_nrl is not None:
+                    counts["nrl"]["fp"] += 1
+                if len(errors) < 5:
+                    errors.append(f"{mssv}: nhan nham (khong co trong doc)")
+
+    result = {
+        "calls": calls,
+        "classified": f"{classified}/{len(docs)}",
+        "docs_per_sec": round(calls / elapsed, 1) if elapsed else 0.0,
+        "mb_per_sec": round(total_bytes / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+    }
+    for field, c in counts.items():
+        precision, recall = score(c["tp"], c["fp"], c["fn"])
+        result[f"{field}_precision"] = precision
+        result[f"{field}_recall"] = recall
+    return result, errors
+
+
+def compare(results, baseline):
+    """So sánh với baseline, trả về danh sách regression về độ chính xác"""
+    regressions = []
+    for layout, current in results.items():
+        base = baseline.get(layout)
+        if not base:
+            continue
+        for key, value in current.items():
+            if not (key.endswith("_precision") or key.endswith("_recall")):
+                continue
+            if key in base and value < base[key] - ACCURACY_TOLERANCE:
+                regressions.append(f"{layout}.{key}: {base[key]} -> {value}")
+        if base.get("mb_per_sec") and current["mb_per_sec"] < base["mb_per_sec"] * (1 - THROUGHPUT_TOLERANCE):
+            print(f"[WARN] {layout}: MB/s giam {base['mb_per_sec']} -> {current['mb_per_sec']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parser find_student_in_content")
+    parser.add_argument("--layouts", nargs="+", default=["curated"] + list(GENERATED_LAYOUTS))
+    parser.add_argument("--queries", type=int, default=15, help="So truy van moi doc sinh tu dong")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--no-layout", action="store_true", help="Khong phan loai layout doc")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'layout':<10} | {'calls':>6} | {'loai':>5} | {'docs/s':>9} | {'MB/s':>7} | "
+          f"{'found P/R':>13} | {'STT P/R':>13} | {'NRL P/R':>13}")
+    print("-" * 98)
+    for layout in args.layouts:
+        docs = curated_corpus() if layout == "curated" else generated_corpus(layout, args.queries)
+        result, errors = run_layout(docs, use_layout=not args.no_layout)
+        results[layout] = result
+        print(f"{layout:<10} | {result['calls']:>6} | {result['classified']:>5} | "
+              f"{result['docs_per_sec']:>9} | {result['mb_per_sec']:>7} | "
+              f"{result['found_precision']:>6}/{result['found_recall']:<6} | "
+              f"{result['stt_precision']:>6}/{result['stt_recall']:<6} | "
+              f"{result['nrl_precision']:>6}/{result['nrl_recall']:<6}")
+        for e in errors:
+            print(f"    - {e}")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n[INFO] Da luu baseline: {BASELINE_FILE}")
+        return
+
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline)
+        if regressions:
+            print("\n[ERROR] Do chinh xac giam so voi baseline:")
+            for r in regressions:
+                print(f"    - {r}")
+            sys.exit(1)
+        print("\n[INFO] Khong co regression so voi baseline")
+
+
+if __name__ == '__main__':
+    main()
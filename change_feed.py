@@ -0,0 +1,446 @@
+"""
+Đăng ký theo dõi thay đổi NRL và nguồn sự kiện /changes
+
+Sinh viên đăng ký MSSV của mình (quản trị viên có thể đăng ký cả roster).
+Tiến trình refresh định kỳ build lại roster, so sánh với lần trước và ghi sự
+kiện cho các MSSV được đăng ký:
+  - added:   MSSV xuất hiện trong doc mới / doc vừa thêm dòng của MSSV
+  - changed: STT hoặc NRL của dòng thay đổi
+  - removed: dòng của MSSV không còn trong doc
+Client hỏi /changes?since=<id> (hoặc long-poll / SSE) thay vì chạy lại /search
+trên toàn bộ corpus. Mỗi lần hỏi gia hạn đăng ký (touch); đăng ký không được hỏi
+trong `ttl` giây (trình duyệt đã đóng) hết hạn và bị dọn (sweep). Đăng ký mới chưa
+được hỏi lần nào chỉ sống `pending_ttl` giây (trang web hỏi ngay sau khi đăng ký),
+để các đăng ký tạo ra rồi bỏ đó không chiếm chỗ cả tuần.
+
+Khi chạy nhiều process (launcher --prod với WEB_WORKERS > 1) đặt `directory`:
+mỗi đăng ký là một file trong directory/subscriptions/ (mtime = lần hỏi cuối),
+sự kiện được ghi nối vào directory/events.jsonl bởi MỘT tiến trình refresh, các
+worker đọc lại file. Trạng thái so sánh lần trước lưu ở directory/snapshot.json
+để tiến trình refresh khởi động lại vẫn so sánh tiếp, không mất thay đổi trong
+khoảng bị gián đoạn.
+"""
+import json
+import math
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from roster import MISSING_STT
+
+ALL = "*"  # Đăng ký cả roster
+RE_SUBSCRIPTION_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+POLL_INTERVAL = 0.5  # Giây, khi chờ sự kiện từ file (nhiều process)
+SWEEP_INTERVAL = 60  # Giây giữa các lần count() quét lại / dọn đăng ký hết hạn
+
+
+def snapshot_from_roster(roster):
+    """
+    Trạng thái so sánh của một roster:
+    ({mssv: {doc_id: (stt, nrl)}}, {mssv: {doc_id: tên trên dòng}}, {doc_id: doc},
+    {doc_id không đọc được}). Một doc có nhiều dòng cùng MSSV thì lấy dòng đầu tiên.
+    """
+    doc_ids = [d["doc_id"] or d["link"] for d in roster.docs]
+    rows = {}
+    names = {}
+    columns = zip(roster.row_mssv, roster.row_name, roster.row_doc, roster.row_stt, roster.row_nrl)
+    for mssv, name, doc_idx, stt, nrl in columns:
+        per_doc = rows.setdefault(mssv, {})
+        doc_id = doc_ids[doc_idx]
+        if doc_id not in per_doc:
+            per_doc[doc_id] = (stt if stt != MISSING_STT else None, None if math.isnan(nrl) else nrl)
+            names.setdefault(mssv, {})[doc_id] = name
+    docs = {doc_id: doc for doc_id, doc in zip(doc_ids, roster.docs)}
+    unreadable = {doc_ids[i] for i in roster.unreadable}
+    return rows, names, docs, unreadable
+
+
+class ChangeFeed:
+    def __init__(self, max_events=10000, directory=None, ttl=7 * 86400, pending_ttl=600):
+        self.max_events = max_events
+        self.directory = directory
+        self.ttl = ttl
+        self.pending_ttl = min(pending_ttl, ttl)
+        self._events = deque(maxlen=max_events)
+        self._last_id = 0
+        self._subscriptions = {}  # id -> {"mssv", "ten_sv", "created"}
+        self._seen = {}  # id -> thời điểm hỏi cuối (chế độ RAM)
+        self._count = None
+        self._swept_at = 0.0
+        self._state = None  # (rows, names, docs) của lần refresh trước
+        self._cond = threading.Condition()
+        self._file_id = None
+        self._offset = 0
+        self._file_events = 0
+        self._subs_cache = (None, {})
+        if directory:
+            os.makedirs(os.path.join(directory, "subscriptions"), exist_ok=True)
+            self._sync()
+
+    # =====================
+    # ĐĂNG KÝ
+    # =====================
+    def subscribe(self, mssv, ten_sv=""):
+        """Đăng ký theo dõi một MSSV (hoặc ALL: cả roster), trả về ID đăng ký"""
+        subscription_id = secrets.token_urlsafe(16)
+        sub = {"mssv": mssv, "ten_sv": ten_sv, "created": datetime.now().isoformat(timespec='seconds')}
+        # Lần hỏi cuối lùi về quá khứ để đăng ký hết hạn sau pending_ttl nếu chưa được hỏi
+        seen = time.time() - self.ttl + self.pending_ttl
+        if self.directory:
+            path = self._subscription_path(subscription_id)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(sub, f, ensure_ascii=False)
+            os.utime(tmp, (seen, seen))
+            os.replace(tmp, path)
+            with self._cond:
+                if self._count is not None:
+                    self._count += 1
+        else:
+            with self._cond:
+                self._subscriptions[subscription_id] = sub
+                self._seen[subscription_id] = seen
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        if not self._valid_id(subscription_id):
+            return False
+        if self.directory:
+            try:
+                os.remove(self._subscription_path(subscription_id))
+            except OSError:
+                return False
+            with self._cond:
+                if self._count:
+                    self._count -= 1
+            return True
+        with self._cond:
+            self._seen.pop(subscription_id, None)
+            return self._subscriptions.pop(subscription_id, None) is not None
+
+    def get_subscription(self, subscription_id):
+        """Đăng ký theo ID, None nếu không có hoặc đã hết hạn"""
+        if not self._valid_id(subscription_id):
+            return None
+        now = time.time()
+        if not self.directory:
+            with self._cond:
+                if now - self._seen.get(subscription_id, 0) > self.ttl:
+                    return None
+                return self._subscriptions.get(subscription_id)
+        path = self._subscription_path(subscription_id)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def touch(self, subscription_id):
+        """Gia hạn đăng ký (mỗi lần client hỏi /changes)"""
+        if not self._valid_id(subscription_id):
+            return
+        if self.directory:
+            try:
+                os.utime(self._subscription_path(subscription_id))
+            except OSError:
+                pass
+            return
+        with self._cond:
+            if subscription_id in self._subscriptions:
+                self._seen[subscription_id] = time.time()
+
+    def sweep(self):
+        """Xóa các đăng ký hết hạn, trả về số đăng ký đã xóa"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        if not self.directory:
+            with self._cond:
+                for subscription_id in [i for i, seen in self._seen.items() if seen < cutoff]:
+                    del self._seen[subscription_id]
+                    self._subscriptions.pop(subscription_id, None)
+                    removed += 1
+                self._count = len(self._subscriptions)
+                self._swept_at = time.monotonic()
+            return removed
+
+        count = 0
+        with os.scandir(os.path.join(self.directory, "subscriptions")) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                    else:
+                        count += 1
+                except OSError:
+                    continue
+        with self._cond:
+            self._count = count
+            self._swept_at = time.monotonic()
+        return removed
+
+    def count(self):
+        """
+        Số đăng ký còn hạn (để giới hạn số đăng ký) mà không phải đọc các file đăng ký:
+        dọn lại tối đa mỗi SWEEP_INTERVAL giây, giữa hai lần dọn chỉ cộng / trừ theo các
+        đăng ký của process này (đăng ký mới ở worker khác được tính ở lần dọn sau)
+        """
+        if self._count is None or time.monotonic() - self._swept_at > SWEEP_INTERVAL:
+            self.sweep()
+        if not self.directory:
+            return len(self._subscriptions)
+        return self._count
+
+    def subscriptions(self):
+        """{id: đăng ký}; ở chế độ thư mục chỉ đọc lại khi thư mục thay đổi"""
+        if not self.directory:
+            with self._cond:
+                return dict(self._subscriptions)
+        directory = os.path.join(self.directory, "subscriptions")
+        mtime = os.stat(directory).st_mtime_ns
+        if self._subs_cache[0] == mtime:
+            return self._subs_cache[1]
+        subs = {}
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                sub = self.get_subscription(name[:-5])
+                if sub:
+                    subs[name[:-5]] = sub
+        self._subs_cache = (mtime, subs)
+        return subs
+
+    def watched(self):
+        """Tập MSSV cần ghi sự kiện (chứa ALL nếu có đăng ký cả roster)"""
+        return {sub["mssv"] for sub in self.subscriptions().values()}
+
+    # =====================
+    # GHI SỰ KIỆN
+    # =====================
+    def update(self, roster):
+        """
+        So sánh roster mới với lần trước, ghi sự kiện cho các MSSV được đăng ký.
+        Lần đầu chỉ ghi nhận trạng thái ban đầu (chế độ thư mục: so sánh với trạng thái
+        đã lưu nếu có). Doc không đọc được lần này giữ nguyên trạng thái cũ (không sinh
+        sự kiện removed giả). Trả về các sự kiện mới.
+        """
+        rows, names, docs, unreadable = snapshot_from_roster(roster)
+        if self._state is None and self.directory:
+            self._state = self._load_state()
+        previous = self._state
+        self.sweep()
+        if previous is not None and unreadable:
+            for mssv, per_doc in previous[0].items():
+                for doc_id, value in per_doc.items():
+                    if doc_id in unreadable:
+                        rows.setdefault(mssv, {}).setdefault(doc_id, value)
+                        names.setdefault(mssv, {}).setdefault(doc_id, previous[1].get(mssv, {}).get(doc_id, ""))
+        self._state = (rows, names, docs)
+        if self.directory:
+            self._save_state()
+        if previous is None:
+            return []
+
+        old_rows, old_names, old_docs = previous
+        watched = self.watched()
+        if ALL in watched:
+            watched = rows.keys() | old_rows.keys()
+
+        now = datetime.now().isoformat(timespec='seconds')
+        events = []
+        for mssv in sorted(watched):
+            old = old_rows.get(mssv, {})
+            new = rows.get(mssv, {})
+            for doc_id in sorted(old.keys() | new.keys()):
+                before = old.get(doc_id)
+                after = new.get(doc_id)
+                if before == after:
+                    continue
+                # Tên trên chính dòng của doc (dòng bị xóa: tên ở lần trước)
+                name = names.get(mssv, {}).get(doc_id) or old_names.get(mssv, {}).get(doc_id, "")
+                doc = docs.get(doc_id) or old_docs.get(doc_id) or {}
+                event = {
+                    "time": now,
+                    "type": "added" if before is None else "removed" if after is None else "changed",
+                    "mssv": mssv,
+                    "name": name,
+                    "doc_id": doc_id,
+                    "doc_name": doc.get("name", ""),
+                    "link": doc.get("link", ""),
+                    "stt": after[0] if after else None,
+                    "nrl": after[1] if after else None,
+                }
+                if before is not None:
+                    event["old_stt"], event["old_nrl"] = before
+                events.append(event)
+
+        if events:
+            self._append(events)
+        return events
+
+    def _save_state(self):
+        rows, names, docs = self._state
+        path = self._state_path()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"rows": rows, "names": names, "docs": docs}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _load_state(self):
+        """Trạng thái đã lưu; file hỏng / sai định dạng (phiên bản cũ) coi như chưa có mốc"""
+        path = self._state_path()
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            # JSON lưu (stt, nrl) thành list: đổi lại tuple để so sánh với roster mới
+            rows = {mssv: {doc_id: tuple(value) for doc_id, value in per_doc.items()}
+                    for mssv, per_doc in data["rows"].items()}
+            names = {mssv: dict(per_doc) for mssv, per_doc in data["names"].items()}
+            docs = dict(data["docs"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"[WARN] Bo qua {path}: {e}")
+            return None
+        return rows, names, docs
+
+    def _append(self, events):
+        with self._cond:
+            if self.directory:
+                self._sync_locked()
+            for event in events:
+                self._last_id += 1
+                event["id"] = self._last_id
+            self._events.extend(events)
+            if self.directory:
+                path = self._events_path()
+                with open(path, 'a', encoding='utf-8') as f:
+                    for event in events:
+                        f.write(json.dumps(event, ensure_ascii=False) + '\n')
+                self._file_events += len(events)
+                if self._file_events > 2 * self.max_events:
+                    self._compact(path)
+                else:
+                    self._offset = os.path.getsize(path)
+                    self._file_id = self._stat_id(path)
+            self._cond.notify_all()
+
+    def _compact(self, path):
+        """Chỉ giữ max_events sự kiện mới nhất trong file (gọi khi đang giữ lock)"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for event in self._events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        os.replace(tmp, path)
+        self._file_id = self._stat_id(path)
+        self._offset = os.path.getsize(path)
+        self._file_events = len(self._events)
+
+    # =====================
+    # ĐỌC SỰ KIỆN
+    # =====================
+    @property
+    def last_id(self):
+        self._sync()
+        return self._last_id
+
+    def since(self, since_id, mssv=None, match=None, limit=500):
+        """
+        Sự kiện có id > since_id, lọc theo MSSV và hàm match(event) nếu có.
+        reset=True: các sự kiện sau since_id đã bị bỏ khỏi bộ đệm (hoặc server khởi động
+        lại) -> client nên tra cứu lại một lần bằng /search rồi theo dõi tiếp từ last_id.
+        """
+        self._sync()
+        with self._cond:
+            oldest = self._events[0]["id"] if self._events else self._last_id + 1
+            reset = since_id > self._last_id or (since_id > 0 and since_id < oldest - 1)
+            events = [e for e in self._events
+                      if e["id"] > since_id and (mssv is None or e["mssv"] == mssv)]
+            last_id = self._last_id
+
+        if match is not None:
+            events = [e for e in events if match(e)]
+        if len(events) > limit:
+            events = events[:limit]
+            last_id = events[-1]["id"]
+        return {"events": events, "last_id": last_id, "reset": reset}
+
+    def poll(self, since_id, mssv=None, match=None, timeout=0, limit=500):
+        """Như since(); chưa có sự kiện phù hợp thì chờ tối đa timeout giây (long-poll)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.since(since_id, mssv, match, limit)
+            remaining = deadline - time.monotonic()
+            if result["events"] or result["reset"] or remaining <= 0:
+                return result
+            since_id = result["last_id"]
+            self.wait(since_id, remaining)
+
+    def wait(self, since_id, timeout):
+        """Chờ đến khi có sự kiện mới hơn since_id hoặc hết thời gian"""
+        if not self.directory:
+            with self._cond:
+                self._cond.wait_for(lambda: self._last_id > since_id, timeout)
+            return
+        deadline = time.monotonic() + timeout
+        while self.last_id <= since_id and time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    def _sync(self):
+        if self.directory:
+            with self._cond:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        """Đọc các sự kiện mới trong file do tiến trình refresh ghi (gọi khi đang giữ lock)"""
+        path = self._events_path()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._offset:
+            # File được compact: đọc lại từ đầu
+            self._file_id = file_id
+            self._offset = 0
+            self._file_events = 0
+            self._events.clear()
+        if stat.st_size == self._offset:
+            return
+        with open(path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # Bỏ dòng đang ghi dở
+        for line in data[:end].splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            self._events.append(event)
+            self._file_events += 1
+            self._last_id = max(self._last_id, event["id"])
+        self._offset += end
+
+    @staticmethod
+    def _stat_id(path):
+        stat = os.stat(path)
+        return stat.st_dev, stat.st_ino
+
+    def _valid_id(self, subscription_id):
+        return bool(subscription_id) and RE_SUBSCRIPTION_ID.match(subscription_id) is not None
+
+    def _subscription_path(self, subscription_id):
+        return os.path.join(self.directory, "subscriptions", f"{subscription_id}.json")
+
+    def _events_path(self):
+        return os.path.join(self.directory, "events.jsonl")
+
+    def _state_path(self):
+        return os.path.join(self.directory, "snapshot.json")
@@ -1,13 +1,33 @@
 """
 NRL Lookup Tool - Launcher
 Mở trình duyệt tự động và chạy server Flask
+
+Chế độ production (phục vụ nhiều người dùng cùng lúc):
+    python launcher.py --prod
+    hoặc đặt biến môi trường SERVER_MODE=production
+
+Cấu hình qua biến môi trường:
+    HOST, PORT          địa chỉ lắng nghe (mặc định 0.0.0.0:5000 khi production)
+    WEB_WORKERS         số process (chỉ hỗ trợ trên Linux/macOS, mặc định 1)
+    WEB_THREADS         số thread mỗi process (mặc định 8)
+    SHUTDOWN_TIMEOUT    số giây chờ các worker dừng khi tắt (mặc định 10)
+    RESULT_STORE_DIR    thư mục dùng chung kết quả tra cứu giữa các worker
+                        (tự đặt là result_cache/ khi WEB_WORKERS > 1)
+    ROSTER_DIR          thư mục dùng chung roster: build ở một process, các worker
+                        nạp lại snapshot (tự đặt là roster_cache/ khi WEB_WORKERS > 1)
+    REFRESH_INTERVAL    số giây giữa các lần làm mới roster / ghi sự kiện thay đổi
+                        (0: tắt); khi WEB_WORKERS > 1 chạy trong một process riêng
+    CHANGES_DIR         thư mục dùng chung đăng ký / sự kiện thay đổi
+                        (tự đặt là changes/ khi WEB_WORKERS > 1)
 """
 import sys
 import os
+import signal
 import webbrowser
 import threading
 import time
 import socket
+from concurrent.futures import ThreadPoolExecutor
 
 # Đảm bảo có thể import từ thư mục hiện tại
 if getattr(sys, 'frozen', False):
@@ -20,7 +40,7 @@ else:
 os.chdir(BASE_DIR)
 
 # Set environment variables
-os.environ['EXCEL_FILE'] = os.path.join(BASE_DIR, 'nrl.xlsx')
+os.environ.setdefault('EXCEL_FILE', os.path.join(BASE_DIR, 'nrl.xlsx'))
 
 def find_free_port():
     """Tìm port trống"""
@@ -35,9 +55,212 @@ def open_browser(port):
     time.sleep(1.5)
     webbrowser.open(f'http://127.0.0.1:{port}')
 
+def is_production(argv):
+    """Chế độ production bật bằng cờ --prod hoặc SERVER_MODE=production"""
+    if '--prod' in argv:
+        return True
+    return os.environ.get('SERVER_MODE', '').lower() in ('prod', 'production')
+
+
+# Worker thoát sớm hơn ngưỡng này (giây) bị coi là lỗi khi khởi động: chờ tăng dần trước khi fork lại
+MIN_WORKER_UPTIME = 10
+MAX_RESPAWN_DELAY = 30
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _respawn_delay(uptime, previous):
+    """Thời gian chờ trước khi fork lại process vừa chết (backoff khi chết ngay sau khởi động)"""
+    if uptime >= MIN_WORKER_UPTIME:
+        return 0
+    return min(max(1, previous * 2), MAX_RESPAWN_DELAY)
+
+
+def _create_listen_socket(host, port):
+    """Tạo socket lắng nghe dùng chung cho mọi worker"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    return sock
+
+
+def _serve_socket(app, sock, threads):
+    """Chạy WSGI server đa luồng trên socket đã mở; dừng êm khi nhận SIGTERM/Ctrl+C"""
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        from waitress import create_server
+    except ImportError:
+        # Không có waitress: dùng server của werkzeug với pool WEB_THREADS thread
+        # (threaded=True của werkzeug tạo thread không giới hạn cho mỗi kết nối)
+        from werkzeug.serving import make_server
+        host, port = sock.getsockname()[:2]
+        server = make_server(host, port, app, threaded=False, fd=sock.fileno())
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+        def handle(request, client_address):
+            try:
+                server.finish_request(request, client_address)
+            except Exception:
+                server.handle_error(request, client_address)
+            finally:
+                server.shutdown_request(request)
+
+        server.process_request = lambda request, client_address: executor.submit(handle, request, client_address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Chờ các request đang xử lý xong rồi mới đóng
+            executor.shutdown(wait=True)
+            server.server_close()
+        return
+
+    server = create_server(app, sockets=[sock], threads=threads)
+    # waitress tự bắt KeyboardInterrupt trong run() và chờ các request đang chạy xong
+    try:
+        server.run()
+    finally:
+        server.close()
+
+
+def _spawn_worker(app, sock, threads):
+    """Fork một worker phục vụ trên socket chung, trả về pid"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _serve_socket(app, sock, threads)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def _spawn_refresher(app_module):
+    """Fork process riêng chạy vòng làm mới (chỉ một process ghi sự kiện thay đổi)"""
+    pid = os.fork()
+    if pid == 0:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            app_module.run_refresher(stop)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os._exit(0)
+    return pid
+
+
+def _stop_workers(pids, timeout):
+    """Gửi SIGTERM cho các worker, hết thời gian chờ thì SIGKILL"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.time() + timeout
+    alive = set(pids)
+    while alive and time.time() < deadline:
+        for pid in list(alive):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                alive.discard(pid)
+        time.sleep(0.1)
+    for pid in alive:
+        print(f"[WARN] Worker {pid} khong dung kip, kill")
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+
+def run_production():
+    """Chạy server production: nhiều process x nhiều thread, cache nạp sẵn trước khi fork"""
+    host = os.environ.get('HOST', '0.0.0.0')
+    port = int(os.environ.get('PORT', 5000))
+    workers = max(1, int(os.environ.get('WEB_WORKERS', 1)))
+    threads = max(1, int(os.environ.get('WEB_THREADS', 8)))
+    shutdown_timeout = int(os.environ.get('SHUTDOWN_TIMEOUT', 10))
+
+    if workers > 1 and not hasattr(os, 'fork'):
+        print("[WARN] He dieu hanh khong ho tro fork, chay 1 process")
+        workers = 1
+
+    if workers > 1:
+        # Kết quả /search phải dùng chung được khi /download rơi vào worker khác
+        os.environ.setdefault('RESULT_STORE_DIR', os.path.join(BASE_DIR, 'result_cache'))
+        # Đăng ký / sự kiện thay đổi dùng chung giữa worker và process làm mới
+        os.environ.setdefault('CHANGES_DIR', os.path.join(BASE_DIR, 'changes'))
+        # Roster build một lần rồi chia sẻ qua file snapshot (/roster/rebuild áp dụng cho mọi worker)
+        os.environ.setdefault('ROSTER_DIR', os.path.join(BASE_DIR, 'roster_cache'))
+
+    import app as app_module
+
+    if app_module.ROSTER_DIR:
+        # File đánh dấu còn sót nếu lần chạy trước bị dừng giữa lúc build roster
+        app_module.release_roster_build()
+
+    # Nạp cache trước khi fork: các worker dùng chung bộ nhớ (copy-on-write)
+    app_module.warm_up()
+
+    sock = _create_listen_socket(host, port)
+    print(f"[INFO] Production server: http://{host}:{port} "
+          f"({workers} process x {threads} thread)")
+
+    if workers == 1:
+        app_module.start_refresher()
+        _serve_socket(app_module.app, sock, threads)
+        print("[INFO] Server da dung")
+        return
+
+    started = {}  # pid -> thời điểm fork
+    for _ in range(workers):
+        started[_spawn_worker(app_module.app, sock, threads)] = time.time()
+    refresher = _spawn_refresher(app_module) if app_module.REFRESH_INTERVAL > 0 else None
+    if refresher:
+        started[refresher] = time.time()
+
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    delay = 0
+    try:
+        # Worker (hoặc process làm mới) nào chết bất thường thì khởi động lại
+        while True:
+            pid, status = os.wait()
+            if pid not in started:
+                continue
+            delay = _respawn_delay(time.time() - started.pop(pid), delay)
+            name = "Process lam moi" if pid == refresher else "Worker"
+            print(f"[WARN] {name} {pid} thoat (status {status}), khoi dong lai sau {delay}s")
+            time.sleep(delay)
+            if pid == refresher:
+                refresher = _spawn_refresher(app_module)
+                started[refresher] = time.time()
+            else:
+                started[_spawn_worker(app_module.app, sock, threads)] = time.time()
+    except KeyboardInterrupt:
+        # Ctrl+C / SIGTERM lần nữa trong lúc tắt không được làm gián đoạn việc dừng worker
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        print("[INFO] Dang tat server...")
+        _stop_workers(list(started), shutdown_timeout)
+    finally:
+        sock.close()
+    print("[INFO] Server da dung")
+
+
 def main():
+    if is_production(sys.argv[1:]):
+        run_production()
+        return
+
     # Import Flask app
-    from app import app
+    from app import app, start_refresher
     
     port = 5000
     
@@ -62,6 +285,8 @@ def main():
     browser_thread.daemon = True
     browser_thread.start()
     
+    start_refresher()
+    
     # Chạy Flask server (production mode, không debug)
     from werkzeug.serving import run_simple
     run_simple('127.0.0.1', port, app, use_reloader=False, use_debugger=False)
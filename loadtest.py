@@ -0,0 +1,93 @@
+"""
+Load test cho NRL Lookup server - đo số request/giây duy trì được
+
+Cách dùng:
+    python launcher.py --prod                       # terminal 1
+    python loadtest.py --url http://127.0.0.1:5000 --concurrency 50 --duration 30
+
+Mặc định bắn GET /health (không phụ thuộc Google Docs). Thêm --search TEN MSSV
+để bắn POST /search.
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def worker(url, data, deadline, latencies, errors, lock):
+    """Gửi request liên tục tới khi hết giờ"""
+    local_lat = []
+    local_err = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, data=data, timeout=30) as r:
+                r.read()
+                if r.status != 200:
+                    local_err += 1
+                    continue
+        except (urllib.error.URLError, OSError):
+            local_err += 1
+            continue
+        local_lat.append(time.perf_counter() - start)
+    with lock:
+        latencies.extend(local_lat)
+        errors[0] += local_err
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test NRL Lookup server")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--search", nargs=2, metavar=("TEN_SV", "MSSV"),
+                        help="Bắn POST /search thay vì GET /health")
+    args = parser.parse_args()
+
+    if args.search:
+        url = args.url.rstrip('/') + '/search'
+        data = urllib.parse.urlencode({"ten_sv": args.search[0], "mssv": args.search[1]}).encode()
+    else:
+        url = args.url.rstrip('/') + '/health'
+        data = None
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+
+    print(f"[INFO] {url} - {args.concurrency} ket noi song song trong {args.duration}s")
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(url, data, deadline, latencies, errors, lock))
+        for _ in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    print("=" * 50)
+    print(f"Thanh cong:   {total}")
+    print(f"Loi:          {errors[0]}")
+    print(f"Requests/sec: {total / elapsed:.1f}")
+    print(f"Latency p50:  {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"Latency p95:  {percentile(latencies, 95) * 1000:.1f} ms")
+    print(f"Latency p99:  {percentile(latencies, 99) * 1000:.1f} ms")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,7 @@ a = Analysis(
         'werkzeug',
         'werkzeug.serving',
         'werkzeug.debug',
+        'waitress',
         'jinja2',
         'markupsafe',
         'itsdangerous',
@@ -0,0 +1,156 @@
+"""
+Nạp corpus offline từ thư mục hoặc file zip chứa các doc đã export
+
+Dùng khi mất mạng / máy không có Internet: mỗi file đặt tên theo doc ID
+(VD: 1mnO48W7lCc5BL-svcNVMtpxvZ49PSMgDe5U_E2BAcoI.txt hoặc .docx).
+File .txt trong thư mục đọc qua mmap, .docx đọc bằng zipfile + XML (không cần
+python-docx); các file / entry trong zip được đọc song song.
+Cùng một doc ID có nhiều file (VD: cả .txt lẫn .docx) thì luôn dùng .txt.
+"""
+import codecs
+import io
+import mmap
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+SUPPORTED_EXTS = ('.txt', '.docx')
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def decode_text(data):
+    return data.decode('utf-8-sig', errors='replace')
+
+
+def read_text_file(path):
+    """
+    Đọc file .txt bằng mmap, giải mã thẳng từ vùng nhớ đã map (không chép ra bytes).
+    File rỗng không mmap được.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            start = len(codecs.BOM_UTF8) if view[:3] == codecs.BOM_UTF8 else 0
+            return str(view[start:], 'utf-8', 'replace')
+
+
+def _paragraph_text(p):
+    parts = []
+    for node in p.iter():
+        if node.tag == W + 't' and node.text:
+            parts.append(node.text)
+        elif node.tag == W + 'tab':
+            parts.append('\t')
+        elif node.tag in (W + 'br', W + 'cr'):
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def docx_to_text(data):
+    """
+    Trích text từ .docx giống bản export txt của Google Docs:
+    mỗi đoạn một dòng, mỗi hàng của bảng một dòng với các ô cách nhau bởi tab.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as docx:
+        root = ElementTree.fromstring(docx.read('word/document.xml'))
+    body = root.find(W + 'body')
+    if body is None:
+        return ""
+
+    lines = []
+    for child in body:
+        if child.tag == W + 'p':
+            lines.append(_paragraph_text(child))
+        elif child.tag == W + 'tbl':
+            for tr in child.iter(W + 'tr'):
+                cells = []
+                for tc in tr.findall(W + 'tc'):
+                    cells.append(' '.join(_paragraph_text(p) for p in tc.findall(W + 'p')).strip())
+                lines.append('\t'.join(cells))
+    return '\n'.join(lines)
+
+
+def _doc_id(name):
+    stem, ext = os.path.splitext(os.path.basename(name))
+    return stem if ext.lower() in SUPPORTED_EXTS and stem else None
+
+
+def _choose_files(candidates):
+    """
+    {doc_id: [tên file]} -> {doc_id: tên file}. Trùng doc ID thì ưu tiên .txt rồi đến
+    tên nhỏ nhất, để kết quả không phụ thuộc thứ tự duyệt thư mục / zip
+    """
+    chosen = {}
+    for doc_id, names in candidates.items():
+        names = sorted(names, key=lambda name: (not name.lower().endswith('.txt'), name))
+        if len(names) > 1:
+            print(f"[WARN] Offline: doc {doc_id} co {len(names)} file, dung {names[0]}, "
+                  f"bo qua {', '.join(names[1:])}")
+        chosen[doc_id] = names[0]
+    return chosen
+
+
+def _read_file(path):
+    if path.lower().endswith('.docx'):
+        with open(path, 'rb') as f:
+            return docx_to_text(f.read())
+    return read_text_file(path)
+
+
+def load_from_directory(directory, max_workers=8):
+    candidates = {}
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            doc_id = _doc_id(filename)
+            if doc_id:
+                candidates.setdefault(doc_id, []).append(os.path.join(dirpath, filename))
+    paths = _choose_files(candidates)
+
+    corpus = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {doc_id: executor.submit(_read_file, path) for doc_id, path in paths.items()}
+        for doc_id, future in futures.items():
+            try:
+                corpus[doc_id] = future.result()
+            except Exception as e:
+                print(f"[ERROR] Offline {paths[doc_id]}: {e}")
+    return corpus
+
+
+def load_from_zip(path, max_workers=8):
+    """Đọc các doc trong file zip, các entry được giải nén song song"""
+    corpus = {}
+    with zipfile.ZipFile(path) as archive:
+        candidates = {}
+        for info in archive.infolist():
+            doc_id = _doc_id(info.filename)
+            if doc_id and not info.is_dir():
+                candidates.setdefault(doc_id, []).append(info.filename)
+        names = _choose_files(candidates)
+
+        def read_entry(name):
+            data = archive.read(name)
+            if name.lower().endswith('.docx'):
+                return docx_to_text(data)
+            return decode_text(data)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {doc_id: executor.submit(read_entry, name) for doc_id, name in names.items()}
+            for doc_id, future in futures.items():
+                try:
+                    corpus[doc_id] = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Offline {names[doc_id]}: {e}")
+    return corpus
+
+
+def load_corpus(path, max_workers=8):
+    """Nạp corpus từ thư mục hoặc file .zip, trả về {doc_id: text}"""
+    if os.path.isdir(path):
+        return load_from_directory(path, max_workers)
+    if zipfile.is_zipfile(path):
+        return load_from_zip(path, max_workers)
+    raise ValueError(f"{path} khong phai thu muc hoac file zip")
@@ -0,0 +1,129 @@
+"""
+Profile một request /search (chế độ quản trị)
+
+Các doc được xử lý trong ThreadPoolExecutor nên cần bắt profile của các thread worker:
+  - Python < 3.12: mỗi lần gọi trong worker có một cProfile riêng, cuối cùng gộp lại
+  - Python >= 3.12: cProfile dùng sys.monitoring, bật một lần là bắt MỌI thread
+    (và chỉ được bật một profiler tại một thời điểm, nên không thể profile riêng
+    từng lần gọi trong worker). Số liệu lẫn cả các request khác chạy đồng thời
+    trong process; report ghi rõ ở trường "mode"
+Vì vậy mỗi lúc chỉ cho phép một request được profile.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+PER_THREAD = sys.version_info < (3, 12)
+MODE = "per-thread" if PER_THREAD else "global (all threads in process, includes concurrent requests)"
+
+_active_lock = threading.Lock()
+
+
+class RequestProfiler:
+    def __init__(self):
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._global_profile = None
+        self._started = None
+        self.elapsed = 0.0
+        self.docs = []
+
+    def start(self):
+        """
+        Bắt đầu profile; trả về False nếu đang có request khác được profile
+        (hoặc, Python >= 3.12, một profiler sys.monitoring khác đang bật)
+        """
+        if not _active_lock.acquire(blocking=False):
+            return False
+        if not PER_THREAD:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                print(f"[WARN] Khong bat duoc profiler: {e}")
+                _active_lock.release()
+                return False
+            self._global_profile = profile
+        self._started = time.perf_counter()
+        return True
+
+    def stop(self):
+        if self._started is None:
+            return
+        if self._global_profile is not None:
+            self._global_profile.disable()
+            self._profiles.append(self._global_profile)
+            self._global_profile = None
+        self.elapsed = time.perf_counter() - self._started
+        self._started = None
+        _active_lock.release()
+
+    def wrap(self, fn):
+        """Bọc hàm chạy trong thread worker để được profile"""
+        if not PER_THREAD:
+            return fn
+
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._profiles_lock:
+                    self._profiles.append(profile)
+        return profiled
+
+    def record_doc(self, doc, timings, found):
+        self.docs.append({
+            "doc_name": doc["name"][:80],
+            "link": doc["link"],
+            "fetch_ms": round(timings.get("fetch", 0) * 1000, 1),
+            "parse_ms": round(timings.get("parse", 0) * 1000, 1),
+            "found": found,
+        })
+
+    def stats(self):
+        if not self._profiles:
+            return None
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def report(self, top=20, slow_docs=10):
+        """Top hàm theo thời gian tự thân (tottime) và các doc chậm nhất"""
+        functions = []
+        stats = self.stats()
+        if stats is not None:
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+            for (filename, line, func), (cc, nc, tt, ct, callers) in rows[:top]:
+                functions.append({
+                    "function": f"{func} ({os.path.basename(filename)}:{line})",
+                    "ncalls": nc,
+                    "tottime_ms": round(tt * 1000, 2),
+                    "cumtime_ms": round(ct * 1000, 2),
+                })
+
+        docs = sorted(self.docs, key=lambda d: d["fetch_ms"] + d["parse_ms"], reverse=True)
+        return {
+            "total_ms": round(self.elapsed * 1000, 1),
+            "mode": MODE,
+            "docs_processed": len(self.docs),
+            "fetch_ms_sum": round(sum(d["fetch_ms"] for d in self.docs), 1),
+            "parse_ms_sum": round(sum(d["parse_ms"] for d in self.docs), 1),
+            "top_functions": functions,
+            "slowest_docs": docs[:slow_docs],
+        }
+
+    def dump(self, path):
+        """Lưu file .prof (mở bằng snakeviz, pstats...)"""
+        stats = self.stats()
+        if stats is None:
+            return None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        stats.dump_stats(path)
+        return path
@@ -0,0 +1,134 @@
+"""
+Lưu kết quả tra cứu phía server theo ID ngắn hạn
+
+/search lưu bộ kết quả và trả về result_id; /download chỉ cần gửi lại ID
+(không upload lại toàn bộ results, client cũng không sửa được total_nrl).
+
+Bộ nhớ có giới hạn số entry (LRU) và hết hạn theo TTL. Khi chạy nhiều process
+(launcher --prod với WEB_WORKERS > 1) đặt `directory` để các worker dùng chung
+kết quả qua file JSON.
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+RE_RESULT_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+SWEEP_EVERY = 100
+
+
+class ResultStore:
+    def __init__(self, max_entries=1000, ttl=1800, directory=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self._entries = OrderedDict()  # id -> (created, data, {format: bytes})
+        self._lock = threading.Lock()
+        self._puts = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def put(self, data):
+        """Lưu bộ kết quả, trả về ID"""
+        result_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self._lock:
+            self._entries[result_id] = (now, data, {})
+            self._evict(now)
+            self._puts += 1
+            sweep = self.directory and self._puts % SWEEP_EVERY == 0
+        if self.directory:
+            path = self._path(result_id)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            if sweep:
+                self._sweep_directory(now)
+        return result_id
+
+    def get(self, result_id):
+        """Bộ kết quả theo ID, None nếu không có hoặc đã hết hạn"""
+        entry = self._get_entry(result_id)
+        return entry[1] if entry else None
+
+    def get_export(self, result_id, fmt, render):
+        """
+        File xuất (bytes) theo định dạng, cache lại để tải lần sau không phải tạo lại.
+        render(data) -> bytes
+        """
+        entry = self._get_entry(result_id)
+        if entry is None:
+            return None
+        exports = entry[2]
+        if fmt not in exports:
+            exports[fmt] = render(entry[1])
+        return exports[fmt]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get_entry(self, result_id):
+        if not result_id or not RE_RESULT_ID.match(result_id):
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is not None:
+                if now - entry[0] > self.ttl:
+                    del self._entries[result_id]
+                    return None
+                self._entries.move_to_end(result_id)
+                return entry
+
+        # Có thể được lưu bởi worker khác
+        if not self.directory:
+            return None
+        path = self._path(result_id)
+        try:
+            created = os.path.getmtime(path)
+            if now - created > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry = (created, data, {})
+        with self._lock:
+            self._entries[result_id] = entry
+            self._evict(now)
+        return entry
+
+    def _evict(self, now):
+        """Bỏ entry hết hạn và entry cũ nhất khi vượt giới hạn (gọi khi đang giữ lock)"""
+        while self._entries:
+            oldest_id, (created, _, _) = next(iter(self._entries.items()))
+            if now - created > self.ttl or len(self._entries) > self.max_entries:
+                del self._entries[oldest_id]
+            else:
+                break
+
+    def _path(self, result_id):
+        return os.path.join(self.directory, f"{result_id}.json")
+
+    def _sweep_directory(self, now):
+        """Xóa file hết hạn, giữ tối đa max_entries file mới nhất"""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort(reverse=True)
+        for i, (mtime, path) in enumerate(files):
+            if i >= self.max_entries or now - mtime > self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
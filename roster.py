@@ -0,0 +1,283 @@
+"""
+Bảng tổng hợp NRL toàn bộ corpus (roster)
+
+Dữ liệu lưu dạng cột (mỗi trường một mảng, số dùng array.array) để lọc/sắp xếp
+nhanh mà không cần numpy/pandas (bản exe loại bỏ 2 thư viện này).
+Thứ tự sắp xếp theo từng cột được tính sẵn một lần khi build.
+
+Khi chạy nhiều process, process build ghi các dòng thô ra file snapshot
+(save_snapshot) để các process khác nạp lại (load_snapshot) thay vì quét lại corpus.
+"""
+import json
+import math
+import os
+from array import array
+from collections import Counter
+from datetime import datetime
+
+MISSING_STT = -1
+SORT_FIELDS = ("mssv", "name", "class_name", "cohort", "total_nrl", "doc_count")
+MAX_PAGE_SIZE = 500
+
+
+def get_cohort(mssv):
+    """Khóa tuyển sinh lấy từ 2 số đầu MSSV (năm nhập học), VD: 2433520225 -> K24"""
+    return f"K{mssv[:2]}" if len(mssv) >= 2 else ""
+
+
+def _most_common(values):
+    values = [v for v in values if v]
+    return Counter(values).most_common(1)[0][0] if values else ""
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    if lo == hi:
+        return sorted_values[lo]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _distribution(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2),
+        "min": values[0],
+        "p25": round(_percentile(values, 0.25), 2),
+        "median": round(_percentile(values, 0.5), 2),
+        "p75": round(_percentile(values, 0.75), 2),
+        "max": values[-1],
+    }
+
+
+class RosterTable:
+    """
+    Roster dạng cột, build một lần từ toàn bộ các dòng (MSSV, tên, lớp, doc, STT, NRL)
+    trích được trong corpus.
+
+    rows: list các dict {"mssv", "name", "class_name", "doc_idx", "stt", "nrl"}
+    docs: list các doc (index khớp với doc_idx)
+    normalize: hàm chuẩn hóa tên để tìm kiếm không dấu
+    unreadable: index các doc không đọc được khi build (không có dòng nào)
+    """
+
+    def __init__(self, rows, docs, normalize=str.lower, unreadable=()):
+        self.docs = [{"doc_id": d.get("doc_id"), "name": d.get("name", ""), "link": d["link"]} for d in docs]
+        self.unreadable = set(unreadable)
+        self.built_at = datetime.now().isoformat(timespec='seconds')
+
+        # --- Bảng dòng thô ---
+        self.row_mssv = [r["mssv"] for r in rows]
+        self.row_name = [r["name"] for r in rows]
+        self.row_doc = array('i', (r["doc_idx"] for r in rows))
+        self.row_stt = array('i', (r["stt"] if r["stt"] is not None else MISSING_STT for r in rows))
+        self.row_nrl = array('d', (r["nrl"] if r["nrl"] is not None else math.nan for r in rows))
+
+        # --- Gom theo MSSV ---
+        groups = {}
+        for idx, r in enumerate(rows):
+            groups.setdefault(r["mssv"], []).append(idx)
+
+        self.mssv = []
+        self.name = []
+        self.name_norm = []
+        self.class_name = []
+        self.cohort = []
+        self.total_nrl = array('d')
+        self.doc_count = array('i')
+        self.missing_nrl = array('i')
+        self.conflict_count = array('i')
+        self.issues = []
+
+        for mssv in sorted(groups):
+            idxs = groups[mssv]
+            name = _most_common(rows[i]["name"] for i in idxs)
+            class_name = _most_common(rows[i]["class_name"] for i in idxs)
+
+            names = {normalize(rows[i]["name"]) for i in idxs if rows[i]["name"]}
+            if len(names) > 1:
+                self.issues.append({
+                    "type": "name_mismatch",
+                    "mssv": mssv,
+                    "values": sorted({rows[i]["name"] for i in idxs if rows[i]["name"]}),
+                })
+
+            # Mỗi doc chỉ tính 1 lần; nhiều dòng trong cùng doc -> trùng lặp hoặc mâu thuẫn
+            by_doc = {}
+            for i in idxs:
+                by_doc.setdefault(rows[i]["doc_idx"], []).append(i)
+
+            total = 0.0
+            missing = 0
+            conflicts = 0
+            for doc_idx, doc_rows in by_doc.items():
+                values = [rows[i]["nrl"] for i in doc_rows if rows[i]["nrl"] is not None]
+                if not values:
+                    missing += 1
+                else:
+                    total += values[0]
+                if len(doc_rows) > 1:
+                    distinct = sorted(set(values))
+                    issue_type = "conflict" if len(distinct) > 1 else "duplicate"
+                    if issue_type == "conflict":
+                        conflicts += 1
+                    self.issues.append({
+                        "type": issue_type,
+                        "mssv": mssv,
+                        "doc": self.docs[doc_idx],
+                        "values": distinct,
+                        "rows": len(doc_rows),
+                    })
+
+            self.mssv.append(mssv)
+            self.name.append(name)
+            self.name_norm.append(normalize(name) if name else "")
+            self.class_name.append(class_name)
+            self.cohort.append(get_cohort(mssv))
+            self.total_nrl.append(round(total, 2))
+            self.doc_count.append(len(by_doc))
+            self.missing_nrl.append(missing)
+            self.conflict_count.append(conflicts)
+
+        self._normalize = normalize
+        self._index = {m: i for i, m in enumerate(self.mssv)}
+        self._order = {
+            "mssv": list(range(len(self.mssv))),
+            "name": sorted(range(len(self.mssv)), key=lambda i: self.name_norm[i]),
+            "class_name": sorted(range(len(self.mssv)), key=lambda i: (self.class_name[i], self.mssv[i])),
+            "cohort": sorted(range(len(self.mssv)), key=lambda i: (self.cohort[i], self.mssv[i])),
+            "total_nrl": sorted(range(len(self.mssv)), key=lambda i: self.total_nrl[i]),
+            "doc_count": sorted(range(len(self.mssv)), key=lambda i: self.doc_count[i]),
+        }
+
+    def __len__(self):
+        return len(self.mssv)
+
+    @property
+    def total_rows(self):
+        return len(self.row_mssv)
+
+    def student(self, i):
+        return {
+            "mssv": self.mssv[i],
+            "name": self.name[i],
+            "class_name": self.class_name[i],
+            "cohort": self.cohort[i],
+            "total_nrl": self.total_nrl[i],
+            "doc_count": self.doc_count[i],
+            "missing_nrl": self.missing_nrl[i],
+            "conflicts": self.conflict_count[i],
+        }
+
+    def get_student(self, mssv):
+        """Thông tin tổng hợp của một MSSV, None nếu không có trong roster"""
+        i = self._index.get(mssv)
+        return self.student(i) if i is not None else None
+
+    def student_docs(self, mssv):
+        """Các dòng chi tiết (doc, STT, NRL) của một sinh viên"""
+        details = []
+        for j, m in enumerate(self.row_mssv):
+            if m != mssv:
+                continue
+            nrl = self.row_nrl[j]
+            stt = self.row_stt[j]
+            details.append({
+                "doc": self.docs[self.row_doc[j]],
+                "stt": stt if stt != MISSING_STT else None,
+                "nrl": None if math.isnan(nrl) else nrl,
+            })
+        return details
+
+    def query(self, q="", class_name="", cohort="", min_nrl=None, max_nrl=None,
+              conflicts_only=False, sort="mssv", desc=False, page=1, page_size=50):
+        """Lọc + sắp xếp + phân trang danh sách sinh viên"""
+        if sort not in SORT_FIELDS:
+            sort = "mssv"
+        page = max(1, page)
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        q_norm = self._normalize(q) if q else ""
+
+        order = self._order[sort]
+        if desc:
+            order = reversed(order)
+
+        matched = []
+        for i in order:
+            if q_norm and not (self.mssv[i].startswith(q) or q_norm in self.name_norm[i]):
+                continue
+            if class_name and self.class_name[i] != class_name:
+                continue
+            if cohort and self.cohort[i] != cohort:
+                continue
+            if min_nrl is not None and self.total_nrl[i] < min_nrl:
+                continue
+            if max_nrl is not None and self.total_nrl[i] > max_nrl:
+                continue
+            if conflicts_only and not self.conflict_count[i]:
+                continue
+            matched.append(i)
+
+        start = (page - 1) * page_size
+        return {
+            "total": len(matched),
+            "page": page,
+            "page_size": page_size,
+            "sort": sort,
+            "desc": desc,
+            "built_at": self.built_at,
+            "items": [self.student(i) for i in matched[start:start + page_size]],
+        }
+
+    def leaderboard(self, limit=10):
+        order = self._order["total_nrl"]
+        return [self.student(i) for i in list(reversed(order))[:limit]]
+
+    def stats(self):
+        """Phân bố tổng NRL theo lớp và theo khóa"""
+        by_class = {}
+        by_cohort = {}
+        for i in range(len(self.mssv)):
+            by_class.setdefault(self.class_name[i] or "-", []).append(self.total_nrl[i])
+            by_cohort.setdefault(self.cohort[i] or "-", []).append(self.total_nrl[i])
+        return {
+            "built_at": self.built_at,
+            "total_students": len(self.mssv),
+            "total_rows": self.total_rows,
+            "total_docs": len(self.docs),
+            "unreadable_docs": len(self.unreadable),
+            "overall": _distribution(list(self.total_nrl)),
+            "classes": {k: _distribution(v) for k, v in sorted(by_class.items())},
+            "cohorts": {k: _distribution(v) for k, v in sorted(by_cohort.items())},
+        }
+
+
+def save_snapshot(path, rows, roster):
+    """Ghi các dòng thô của roster ra file JSON (ghi file tạm rồi đổi tên)"""
+    data = {
+        "built_at": roster.built_at,
+        "docs": roster.docs,
+        "unreadable": sorted(roster.unreadable),
+        "rows": [[r["mssv"], r["name"], r["class_name"], r["doc_idx"], r["stt"], r["nrl"]] for r in rows],
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path, normalize=str.lower):
+    """RosterTable từ file của save_snapshot, giữ nguyên thời điểm build"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    fields = ("mssv", "name", "class_name", "doc_idx", "stt", "nrl")
+    rows = [dict(zip(fields, row)) for row in data["rows"]]
+    roster = RosterTable(rows, data["docs"], normalize=normalize, unreadable=data["unreadable"])
+    roster.built_at = data["built_at"]
+    return roster